@@ -7,8 +7,10 @@ type="${1:-prod}"
 
 if [ "$type" = "dev" ]; then
   python manage.py migrate
+  python manage.py createcachetable
   exec python manage.py runserver 0.0.0.0:8000 --force-color
 else
   python manage.py migrate
+  python manage.py createcachetable
   exec /base/gunicorn.sh sortiment.wsgi
 fi
@@ -62,6 +62,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "sortiment.store.middleware.TerminalMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_htmx.middleware.HtmxMiddleware",
@@ -159,9 +160,27 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "unique-snowflake",
         "OPTIONS": {"MAX_ENTRIES": 5000},
-    }
+    },
+    # shared by all workers, see `createcachetable`
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "sortiment_cache",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
 }
 
+# Checkout only debits the credit and queues the basket, the ledger is
+# written in the background (see the `flush_checkouts` command)
+CHECKOUT_WRITE_BEHIND = os.environ.get("CHECKOUT_WRITE_BEHIND", "").lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+# Number of stock rows a product with sharded stock is split into
+STOCK_SHARDS = 8
+
 if DEBUG:
     import socket
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from django.contrib.admin import ModelAdmin
+from django.contrib.admin import ModelAdmin, TabularInline
 
 from sortiment.store import models
 from sortiment.store.models import Reset
@@ -16,14 +16,34 @@ class ProductAdmin(ModelAdmin):
     list_filter = (
         "is_unlimited",
         "is_dummy",
+        "sharded_stock",
     )
 
+    def get_deleted_objects(self, objs, request):
+        to_delete, model_count, perms_needed, protected = super().get_deleted_objects(
+            objs, request
+        )
+        # queued checkouts reference products by id only, protect them here
+        queued = [
+            f"{models.QueuedCheckout._meta.verbose_name}: {q}"
+            for q in models.QueuedCheckout.with_products(obj.pk for obj in objs)
+        ]
+        return to_delete, model_count, perms_needed, protected + queued
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # tags are saved after the product, stamp it again to publish them
+        form.instance.save(update_fields=["version"])
+
+
+class TerminalInline(TabularInline):
+    model = models.Terminal
+    extra = 1
+
 
 class WarehouseAdmin(ModelAdmin):
-    list_display = (
-        "name",
-        "ip",
-    )
+    list_display = ("name",)
+    inlines = (TerminalInline,)
 
 
 class WarehouseState(ModelAdmin):
@@ -48,6 +68,32 @@ class WarehouseEventAdmin(ModelAdmin):
     list_filter = ("type",)
 
 
+class ReceiptLineInline(TabularInline):
+    model = models.WarehouseEvent
+    fields = ("product", "quantity", "retail_price")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class ReceiptAdmin(ModelAdmin):
+    list_display = ("timestamp", "user", "warehouse", "total")
+    inlines = (ReceiptLineInline,)
+
+
+class QueuedCheckoutAdmin(ModelAdmin):
+    list_display = ("created_at", "user", "warehouse", "total", "failed_at")
+    list_filter = ("failed_at",)
+    actions = ("retry",)
+
+    @admin.action(description="Zapísať znova")
+    def retry(self, request, queryset):
+        queryset.update(failed_at=None, error="")
+
+
 @admin.register(Reset)
 class ResetAdmin(admin.ModelAdmin):
     list_display = ["created_at", "user", "price_diff"]
@@ -57,4 +103,6 @@ admin.site.register(models.Product, ProductAdmin)
 admin.site.register(models.Warehouse, WarehouseAdmin)
 admin.site.register(models.WarehouseState, WarehouseState)
 admin.site.register(models.WarehouseEvent, WarehouseEventAdmin)
+admin.site.register(models.Receipt, ReceiptAdmin)
+admin.site.register(models.QueuedCheckout, QueuedCheckoutAdmin)
 admin.site.register(models.Tag)
@@ -1,105 +1,175 @@
 from dataclasses import dataclass
+from decimal import Decimal
 
+from django.conf import settings
 from django.http import HttpRequest
 
 from sortiment.store.helpers import get_warehouse
-from sortiment.store.helpers.events import new_purchase
+from sortiment.store.helpers.events import new_receipt, queue_receipt
 from sortiment.store.models import Product
 from sortiment.users.models import SortimentUser
 
 
 @dataclass
 class CartItem:
+    """
+    Cart line built from the snapshot stored in the session. `product` is an
+    unsaved stand-in carrying the name, price and image seen when the line
+    was added; it is only checked against the database at checkout.
+    """
+
     product: Product
     quantity: int
     dummy: bool
+    price: Decimal | None = None
+
+    @property
+    def unit_price(self):
+        # one-time items carry their own price
+        return self.product.price if self.price is None else self.price
 
     @property
     def total_price(self):
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
+
+
+def line_key(product_id: int, price: Decimal | None = None) -> str:
+    # one-time items share a product, so each price gets its own line
+    return str(product_id) if price is None else f"{product_id}:{price}"
+
+
+def _snapshot(product: Product) -> dict:
+    return {
+        "product": product.id,
+        "name": product.name,
+        "price": str(product.price),
+        "image": product.image.name or "",
+    }
 
 
 class Cart:
+    """
+    Shopping cart kept in the session as a dict of line key -> snapshot.
+
+    Adding or removing a product touches a single entry and needs no product
+    lookups; prices are revalidated against the database at checkout.
+    """
+
     def __init__(self, request: HttpRequest):
         self.request = request
-        self.items: list[CartItem] = []
-        self._load_session()
+        self.lines: dict[str, dict] = request.session.get("cart")
+        if not isinstance(self.lines, dict):
+            self.lines = {}
+        self.outdated = False
 
-    def _load_session(self):
-        cart = self.request.session.get("cart", [])
-        products = Product.objects.filter(id__in=[i["product"] for i in cart]).all()
-        product_map = {p.id: p for p in products}
-        self.items.clear()
-
-        for item in cart:
-            if item["product"] not in product_map and not item["dummy"]:
-                continue
-            if item["quantity"] <= 0:
-                continue
-            self.items.append(
-                CartItem(product_map[item["product"]], item["quantity"], item["dummy"])
+    @property
+    def items(self) -> list[CartItem]:
+        items = []
+        for line in self.lines.values():
+            product = Product(
+                id=line["product"],
+                name=line["name"],
+                price=Decimal(line["price"]),
+                image=line["image"],
+                is_dummy=line["dummy"],
+            )
+            price = line.get("line_price")
+            items.append(
+                CartItem(
+                    product,
+                    line["quantity"],
+                    line["dummy"],
+                    Decimal(price) if price is not None else None,
+                )
             )
+        return items
 
     def _save_session(self):
-        data = []
-        for item in self.items:
-            if item.quantity <= 0:
-                continue
-            data.append(
-                {
-                    "product": item.product.id,
-                    "quantity": item.quantity,
-                    "dummy": item.dummy,
+        self.request.session["cart"] = self.lines
+        self.request.session.modified = True
+
+    def update(self, changes: list[tuple[Product, int, Decimal | None]]):
+        """
+        Applies several (product, delta, one-time price) changes at once.
+        Lines whose quantity drops to zero are removed. The session is only
+        written after all changes were applied.
+        """
+        lines = {key: dict(line) for key, line in self.lines.items()}
+        for product, delta, price in changes:
+            key = line_key(product.id, price)
+            line = lines.get(key)
+            if line is None:
+                if delta <= 0:
+                    continue
+                line = lines[key] = {
+                    **_snapshot(product),
+                    "quantity": 0,
+                    "dummy": price is not None,
+                    "line_price": str(price) if price is not None else None,
                 }
-            )
-        self.request.session["cart"] = data
 
-    def add_product(self, product: Product, quantity: int = 1, dummy: bool = False):
-        if quantity <= 0:
-            raise ValueError("Quantity must be greater than 0.")
+            line["quantity"] += delta
+            if line["quantity"] <= 0:
+                del lines[key]
 
-        for i in range(len(self.items)):
-            item = self.items[i]
-            if item.product == product:
-                self.items[i].quantity += quantity
-                self._save_session()
-                return
-
-        self.items.append(CartItem(product, quantity, dummy))
+        self.lines = lines
         self._save_session()
 
-    def remove_product(self, product: Product, quantity: int = 1):
+    def add_product(
+        self, product: Product, quantity: int = 1, price: Decimal | None = None
+    ):
         if quantity <= 0:
             raise ValueError("Quantity must be greater than 0.")
-
-        for i in range(len(self.items)):
-            item = self.items[i]
-            if item.product == product:
-                item.quantity -= quantity
-                self.items[i] = item
-                if item.quantity <= 0:
-                    del self.items[i]
-                break
-
-        self._save_session()
+        self.update([(product, quantity, price)])
 
     @property
     def total_price(self):
         return sum([i.total_price for i in self.items])
 
+    def revalidate(self) -> dict[int, Product] | None:
+        """
+        Loads the products in the cart. Lines whose product was deleted are
+        dropped and changed names or prices are refreshed; in that case the
+        customer has to confirm the cart again and None is returned.
+        """
+        ids = {line["product"] for line in self.lines.values()}
+        products = Product.objects.in_bulk(ids)
+
+        changed = False
+        for key, line in list(self.lines.items()):
+            product = products.get(line["product"])
+            if product is None:
+                del self.lines[key]
+                changed = True
+                continue
+
+            snapshot = _snapshot(product)
+            if any(line[k] != v for k, v in snapshot.items()):
+                line.update(snapshot)
+                # the price of one-time items lives on the line itself
+                changed = changed or not line["dummy"]
+
+        self.outdated = changed
+        self._save_session()
+        return None if changed else products
+
     def checkout(self, request):
-        if not isinstance(request.user, SortimentUser):
+        if not isinstance(request.user, SortimentUser) or not self.lines:
             return False
-        if not request.user.can_pay(self.total_price):
+
+        products = self.revalidate()
+        if products is None:
             return False
 
-        warehouse = get_warehouse(request)
-        for item in self.items:
-            new_purchase(request.user, item.product, warehouse, item.quantity)
-        request.user.make_credit_operation(
-            -self.total_price, is_purchase=True, warehouse=warehouse
-        )
-        return True
+        lines = [
+            (products[item.product.id], item.quantity, item.unit_price)
+            for item in self.items
+        ]
+        if settings.CHECKOUT_WRITE_BEHIND:
+            receipt = queue_receipt(request.user, get_warehouse(request), lines)
+        else:
+            receipt = new_receipt(request.user, get_warehouse(request), lines)
+        return receipt is not None
 
 
 class CartContext:
@@ -0,0 +1,237 @@
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping
+
+from django.db.models import Max, Sum
+
+from sortiment.store.models import (
+    ONE_TIME_BARCODE,
+    CatalogVersion,
+    Product,
+    Tag,
+    WarehouseState,
+    WarehouseStateShard,
+)
+
+
+@dataclass(frozen=True)
+class Catalog:
+    """
+    Immutable snapshot of everything the storefront reads on each request.
+
+    Snapshots are shared between all requests served by the worker and must
+    never be modified. A new one is built when products or tags change; when
+    only stock changes, the new one shares everything else with the old one.
+    """
+
+    version: int
+    catalog_version: int
+    products: Mapping[int, Product]
+    listed: tuple[Product, ...]
+    barcodes: Mapping[str, int]
+    tags: tuple[Tag, ...]
+    tag_products: Mapping[str, frozenset[int]]
+    stock: Mapping[int, Mapping[int, int]]
+    total_stock: Mapping[int, int]
+    stock_versions: Mapping[int, int]
+
+    def by_barcode(self, barcode: str) -> Product | None:
+        product_id = self.barcodes.get(barcode)
+        if product_id is None:
+            return None
+        return self.products[product_id]
+
+    def one_time_item(self, price: Decimal, barcode: str) -> Product:
+        """
+        Unsaved stand-in for the shared one-time product that shows the price
+        and barcode that were scanned.
+        """
+        product = self.by_barcode(ONE_TIME_BARCODE) or Product.get_one_time_product()
+        return Product(
+            id=product.id,
+            name=product.name,
+            barcode=barcode,
+            price=price,
+            is_unlimited=True,
+            is_dummy=True,
+            search_name=product.search_name,
+            version=product.version,
+        )
+
+    def tag_counts(self) -> list[tuple[Tag, int]]:
+        return [(t, len(self.tag_products.get(t.name, ()))) for t in self.tags]
+
+    def local_stock(self, warehouse_id: int) -> Mapping[int, int]:
+        return self.stock.get(warehouse_id, MappingProxyType({}))
+
+    def changes_since(self, warehouse_id: int, since: int) -> dict:
+        """
+        Serializes listed products and their stock changed after version
+        `since`. Version 0 (or a version from the future) yields everything.
+        """
+        full = since <= 0 or since > self.version
+        local = self.local_stock(warehouse_id)
+
+        products = []
+        stock = []
+        for p in self.listed:
+            if full or p.version > since:
+                products.append(
+                    {
+                        "id": p.id,
+                        "name": p.name,
+                        "search": p.search_name,
+                        "barcode": p.barcode,
+                        "price": str(p.price),
+                        "image": p.image.url if p.image else None,
+                        "unlimited": p.is_unlimited,
+                    }
+                )
+            if full or self.stock_versions.get(p.id, 0) > since:
+                stock.append([p.id, local.get(p.id, 0), self.total_stock.get(p.id, 0)])
+
+        return {
+            "version": self.version,
+            "full": full,
+            "ids": [p.id for p in self.listed],
+            "products": products,
+            "stock": stock,
+        }
+
+
+def _load_stock(
+    stock: dict[int, dict[int, int]],
+    total_stock: dict[int, int],
+    stock_versions: dict[int, int],
+    **filters,
+):
+    states = WarehouseState.objects.filter(**filters).values_list(
+        "warehouse_id", "product_id", "quantity", "version"
+    )
+    for warehouse_id, product_id, quantity, state_version in states:
+        stock[warehouse_id][product_id] = quantity
+        total_stock[product_id] += quantity
+        stock_versions[product_id] = max(stock_versions[product_id], state_version)
+
+    # sharded stock changes are folded periodically, until then add them here
+    shards = (
+        WarehouseStateShard.objects.filter(**filters)
+        .values_list("warehouse_id", "product_id")
+        .annotate(quantity=Sum("quantity"), version=Max("version"))
+    )
+    for warehouse_id, product_id, quantity, shard_version in shards:
+        stock[warehouse_id][product_id] = (
+            stock[warehouse_id].get(product_id, 0) + quantity
+        )
+        total_stock[product_id] += quantity
+        stock_versions[product_id] = max(stock_versions[product_id], shard_version)
+
+
+def _freeze_stock(
+    stock: dict[int, dict[int, int]],
+    total_stock: dict[int, int],
+    stock_versions: dict[int, int],
+) -> dict:
+    return {
+        "stock": MappingProxyType({w: MappingProxyType(s) for w, s in stock.items()}),
+        "total_stock": MappingProxyType(dict(total_stock)),
+        "stock_versions": MappingProxyType(dict(stock_versions)),
+    }
+
+
+def _build_catalog(version: int, catalog_version: int) -> Catalog:
+    products = {p.id: p for p in Product.objects.order_by("name")}
+
+    stock: dict[int, dict[int, int]] = defaultdict(dict)
+    total_stock: dict[int, int] = defaultdict(int)
+    stock_versions: dict[int, int] = defaultdict(int)
+    _load_stock(stock, total_stock, stock_versions)
+
+    listed = tuple(p for p in products.values() if not p.is_dummy)
+    listed_ids = {p.id for p in listed}
+    tag_products: dict[str, set[int]] = defaultdict(set)
+    memberships = Product.tags.through.objects.values_list("tag__name", "product_id")
+    for tag_name, product_id in memberships:
+        if product_id in listed_ids:
+            tag_products[tag_name].add(product_id)
+
+    return Catalog(
+        version=version,
+        catalog_version=catalog_version,
+        products=MappingProxyType(products),
+        listed=listed,
+        barcodes=MappingProxyType({p.barcode: p.id for p in products.values()}),
+        tags=tuple(Tag.objects.all()),
+        tag_products=MappingProxyType(
+            {name: frozenset(ids) for name, ids in tag_products.items()}
+        ),
+        **_freeze_stock(stock, total_stock, stock_versions),
+    )
+
+
+def _refresh_stock(catalog: Catalog, version: int) -> Catalog:
+    """
+    Copy of `catalog` with the stock of products stamped since its version
+    reloaded. Products and tags are shared with it.
+    """
+    changed = {
+        product_id
+        for model in (WarehouseState, WarehouseStateShard)
+        for product_id in model.objects.filter(version__gt=catalog.version).values_list(
+            "product_id", flat=True
+        )
+    }
+
+    stock: dict[int, dict[int, int]] = defaultdict(dict)
+    for warehouse_id, local in catalog.stock.items():
+        stock[warehouse_id] = {p: q for p, q in local.items() if p not in changed}
+    total_stock: dict[int, int] = defaultdict(int)
+    total_stock.update(
+        (p, q) for p, q in catalog.total_stock.items() if p not in changed
+    )
+    stock_versions: dict[int, int] = defaultdict(int)
+    stock_versions.update(
+        (p, v) for p, v in catalog.stock_versions.items() if p not in changed
+    )
+    if changed:
+        _load_stock(stock, total_stock, stock_versions, product_id__in=changed)
+
+    return replace(
+        catalog,
+        version=version,
+        **_freeze_stock(stock, total_stock, stock_versions),
+    )
+
+
+_catalog: Catalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """
+    Returns the catalog snapshot of this worker. It is rebuilt if products or
+    tags changed since it was built, and only its stock is reloaded if just
+    stock changed.
+    """
+    global _catalog
+
+    version, catalog_version = CatalogVersion.current_versions()
+    catalog = _catalog
+    if catalog is not None and catalog.version >= version:
+        return catalog
+
+    with _catalog_lock:
+        catalog = _catalog
+        if catalog is None or catalog.catalog_version != catalog_version:
+            _catalog = _build_catalog(version, catalog_version)
+        elif catalog.version < version:
+            _catalog = _refresh_stock(catalog, version)
+        return _catalog
+
+
+def invalidate_catalog():
+    global _catalog
+    _catalog = None
@@ -2,7 +2,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.forms import DecimalField, Form, IntegerField, ModelForm, NumberInput
 
-from .models import Product, Warehouse, WarehouseState
+from .models import Product, Warehouse
 
 
 class ProductForm(ModelForm):
@@ -13,24 +13,17 @@ class ProductForm(ModelForm):
             "price": NumberInput(attrs={"min": 0, "step": 0.01}),
         }
 
+    def save(self, commit=True):
+        product = super().save(commit)
+        if commit:
+            # tags are saved after the product, stamp it again to publish them
+            product.save(update_fields=["version"])
+        return product
+
 
 class DiscardForm(Form):
     quantity = IntegerField(min_value=0, label="Počet kusov")
 
-    def __init__(self, warehouse, product, *args, **kwargs):
-        self.warehouse = warehouse
-        self.product = product
-        super().__init__(*args, **kwargs)
-
-    def clean_quantity(self):
-        quantity = self.cleaned_data["quantity"]
-        ws = WarehouseState.objects.filter(
-            product=self.product, warehouse=self.warehouse
-        ).first()
-        if not ws or ws.quantity < quantity:
-            raise ValidationError("Na sklade nie je dostatočný počet kusov.")
-        return quantity
-
 
 class InsertForm(Form):
     quantity = IntegerField(label="Počet kusov", min_value=0)
@@ -49,10 +42,6 @@ class TransferForm(Form):
     )
     quantity = IntegerField(min_value=0, label="Počet kusov")
 
-    def __init__(self, product, *args, **kwargs):
-        self.product = product
-        super().__init__(*args, **kwargs)
-
     def clean_to_warehouse(self):
         from_warehouse = self.cleaned_data["from_warehouse"]
         to_warehouse = self.cleaned_data["to_warehouse"]
@@ -60,16 +49,6 @@ class TransferForm(Form):
             raise ValidationError("Nemôžeš presunúť produkty v rámci jedného skladu.")
         return to_warehouse
 
-    def clean_quantity(self):
-        quantity = self.cleaned_data["quantity"]
-        ws = WarehouseState.objects.filter(
-            product=self.product,
-            warehouse=self.cleaned_data["from_warehouse"],
-        ).first()
-        if not ws or ws.quantity < quantity:
-            raise ValidationError("V zdrojovom sklade nie je dostatočny počet kusov.")
-        return quantity
-
 
 class CorrectionForm(Form):
     quantity = IntegerField(label="Počet kusov")
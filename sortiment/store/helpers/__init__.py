@@ -1,15 +1,14 @@
 import re
+from decimal import Decimal
 
 from django.core.exceptions import PermissionDenied
 from django.http import HttpRequest
-from ipware import get_client_ip
 
 from sortiment.store.models import Warehouse
 
 
 def get_warehouse(request: HttpRequest) -> Warehouse:
-    ip, _ = get_client_ip(request)
-    warehouse = Warehouse.objects.filter(ip=ip).first()
+    warehouse = getattr(request, "warehouse", None)
     if not warehouse:
         raise PermissionDenied()
     return warehouse
@@ -17,5 +16,19 @@ def get_warehouse(request: HttpRequest) -> Warehouse:
 
 def get_dummy_barcode_data(barcode):
     if re.match("^5{6}[0-9]{5}$", barcode):
-        return int(barcode[6:]) / 100
+        return Decimal(barcode[6:]).scaleb(-2)
     return None
+
+
+def parse_scan(code: str) -> tuple[int, str] | None:
+    """
+    Splits scanner input into quantity and barcode. `6*<barcode>` adds six
+    pieces at once.
+    """
+    match = re.match(r"^(?:([0-9]{1,2})\*)?([0-9]+)$", code)
+    if not match:
+        return None
+    quantity = int(match[1] or 1)
+    if quantity <= 0:
+        return None
+    return quantity, match[2]
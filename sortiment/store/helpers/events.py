@@ -1,7 +1,35 @@
+import threading
+from collections import Counter, defaultdict
 from decimal import Decimal
 
-from sortiment.store.models import Product, Warehouse, WarehouseEvent
-from sortiment.users.models import SortimentUser
+from django.db import connection, transaction
+from django.utils import timezone
+
+from sortiment.store.logic import add_popularity
+from sortiment.store.models import (
+    Product,
+    QueuedCheckout,
+    Receipt,
+    Warehouse,
+    WarehouseEvent,
+    WarehouseState,
+)
+from sortiment.users.models import CreditLog, SortimentUser
+
+
+@transaction.atomic
+def record_events(events: list[WarehouseEvent], require_stock: bool = False) -> bool:
+    """
+    Writes unsaved events to the ledger: the stock is updated in a single
+    statement and the events are bulk-inserted.
+
+    With `require_stock`, stock is only taken out of warehouses that hold
+    enough pieces. Otherwise nothing is written and False is returned.
+    """
+    if not WarehouseState.apply_events(events, require_stock):
+        return False
+    WarehouseEvent.objects.bulk_create(events)
+    return True
 
 
 def new_import(
@@ -11,56 +39,279 @@ def new_import(
     quantity: int,
     price: Decimal,
 ):
-    WarehouseEvent.objects.create(
-        user=user,
-        product=product,
-        warehouse=warehouse,
-        type=WarehouseEvent.EventType.IMPORT,
-        quantity=quantity,
-        retail_price=price,
-        price=price,
+    record_events(
+        [
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=warehouse,
+                type=WarehouseEvent.EventType.IMPORT,
+                quantity=quantity,
+                retail_price=price,
+                price=price,
+            )
+        ]
     )
 
 
+@transaction.atomic
 def new_purchase(
-    user: SortimentUser, product: Product, warehouse: Warehouse, quantity: int
+    user: SortimentUser,
+    product: Product,
+    warehouse: Warehouse,
+    quantity: int,
+    price: Decimal | None = None,
 ):
-    WarehouseEvent.objects.create(
-        user=user,
-        product=product,
-        warehouse=warehouse,
-        type=WarehouseEvent.EventType.PURCHASE,
-        quantity=-quantity,
-        retail_price=product.price,
-        price=product.price,
+    if price is None:
+        price = product.price
+
+    record_events(
+        [
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=warehouse,
+                type=WarehouseEvent.EventType.PURCHASE,
+                quantity=-quantity,
+                retail_price=price,
+                price=price,
+            )
+        ]
+    )
+    if not product.is_dummy:
+        add_popularity(warehouse, user, {product.id: quantity})
+
+
+@transaction.atomic
+def new_receipt(
+    user: SortimentUser,
+    warehouse: Warehouse,
+    lines: list[tuple[Product, int, Decimal]],
+) -> Receipt | None:
+    """
+    Records a whole basket of (product, quantity, unit price) lines as one
+    receipt. The lines are inserted and the stock is updated in bulk, so the
+    number of queries does not grow with the size of the basket.
+
+    The credit is debited first with a conditional UPDATE; if the user
+    cannot pay, nothing is written and None is returned.
+    """
+    total = sum(price * quantity for _, quantity, price in lines)
+    if not user.make_credit_operation(-total, is_purchase=True, warehouse=warehouse):
+        return None
+
+    receipt = Receipt.objects.create(user=user, warehouse=warehouse, total=total)
+    record_events(
+        [
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=warehouse,
+                receipt=receipt,
+                type=WarehouseEvent.EventType.PURCHASE,
+                quantity=-quantity,
+                retail_price=price,
+                price=price,
+            )
+            for product, quantity, price in lines
+        ]
+    )
+
+    popularity = Counter()
+    for product, quantity, _ in lines:
+        if not product.is_dummy:
+            popularity[product.id] += quantity
+    if popularity:
+        add_popularity(warehouse, user, popularity)
+
+    return receipt
+
+
+def queue_receipt(
+    user: SortimentUser,
+    warehouse: Warehouse,
+    lines: list[tuple[Product, int, Decimal]],
+) -> QueuedCheckout | None:
+    """
+    Write-behind variant of `new_receipt`. Only the credit is debited right
+    away, the basket is queued and written by `flush_receipts` in the
+    background. Returns None if the user cannot pay.
+    """
+    total = sum(price * quantity for _, quantity, price in lines)
+    with transaction.atomic():
+        if not user.reserve_credit(-total):
+            return None
+        queued = QueuedCheckout.objects.create(
+            user=user,
+            warehouse=warehouse,
+            lines=[[p.id, quantity, str(price)] for p, quantity, price in lines],
+            total=total,
+        )
+        transaction.on_commit(flush_in_background)
+    return queued
+
+
+@transaction.atomic
+def flush_receipts(limit: int = 100) -> int:
+    """
+    Writes up to `limit` queued checkouts as receipts in one batch and
+    returns how many were handled. Checkouts locked by another flusher are
+    skipped.
+
+    If the batch fails, each checkout is written on its own instead, and
+    those that still fail are marked as failed with their error and left
+    for the staff, so they do not block the rest of the queue.
+    """
+    queued = list(
+        QueuedCheckout.objects.select_for_update(skip_locked=True)
+        .filter(failed_at=None)
+        .select_related("user", "warehouse")
+        .order_by("id")[:limit]
+    )
+    if not queued:
+        return 0
+
+    try:
+        with transaction.atomic():
+            _write_checkouts(queued)
+    except Exception:
+        for q in queued:
+            try:
+                with transaction.atomic():
+                    _write_checkouts([q])
+            except Exception as e:
+                QueuedCheckout.objects.filter(pk=q.pk).update(
+                    failed_at=timezone.now(), error=repr(e)
+                )
+    return len(queued)
+
+
+def _write_checkouts(queued: list[QueuedCheckout]):
+    product_ids = {line[0] for q in queued for line in q.lines}
+    products = Product.objects.in_bulk(product_ids)
+    receipts = Receipt.objects.bulk_create(
+        [Receipt(user=q.user, warehouse=q.warehouse, total=q.total) for q in queued]
+    )
+
+    events = []
+    popularity = defaultdict(Counter)
+    for q, receipt in zip(queued, receipts):
+        for product_id, quantity, price in q.lines:
+            product = products.get(product_id)
+            if product is None:
+                # dropping the line would lose the purchase
+                raise Product.DoesNotExist(f"Product {product_id} is gone.")
+            events.append(
+                WarehouseEvent(
+                    user=q.user,
+                    product=product,
+                    warehouse=q.warehouse,
+                    receipt=receipt,
+                    type=WarehouseEvent.EventType.PURCHASE,
+                    quantity=-quantity,
+                    retail_price=Decimal(price),
+                    price=Decimal(price),
+                )
+            )
+            if not product.is_dummy:
+                popularity[(q.warehouse, q.user)][product_id] += quantity
+
+    record_events(events)
+    for (warehouse, user), quantities in popularity.items():
+        add_popularity(warehouse, user, quantities)
+
+    CreditLog.objects.bulk_create(
+        [
+            CreditLog(
+                user=q.user,
+                price=-q.total,
+                is_purchase=True,
+                warehouse=q.warehouse,
+            )
+            for q in queued
+            if q.user and not q.user.is_guest
+        ]
     )
+    QueuedCheckout.objects.filter(id__in=[q.id for q in queued]).delete()
+
+
+_flush_lock = threading.Lock()
+_flush_running = False
+_flush_wanted = False
+
+
+def flush_in_background():
+    """
+    Flushes queued checkouts in a background thread. At most one flusher
+    runs per worker; if it is busy, it makes one more pass when done.
+    """
+    global _flush_running, _flush_wanted
+
+    with _flush_lock:
+        _flush_wanted = True
+        if _flush_running:
+            return
+        _flush_running = True
+
+    threading.Thread(target=_run_flusher, daemon=True).start()
+
+
+def _run_flusher():
+    global _flush_running, _flush_wanted
+
+    try:
+        while True:
+            with _flush_lock:
+                if not _flush_wanted:
+                    _flush_running = False
+                    return
+                _flush_wanted = False
+
+            while flush_receipts():
+                pass
+    except BaseException:
+        with _flush_lock:
+            _flush_running = False
+        raise
+    finally:
+        connection.close()
 
 
 def new_correction(
     user: SortimentUser, product: Product, warehouse: Warehouse, quantity: int
 ):
-    WarehouseEvent.objects.create(
-        user=user,
-        product=product,
-        warehouse=warehouse,
-        type=WarehouseEvent.EventType.CORRECTION,
-        quantity=quantity,
-        retail_price=0,
-        price=0,
+    record_events(
+        [
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=warehouse,
+                type=WarehouseEvent.EventType.CORRECTION,
+                quantity=quantity,
+                retail_price=0,
+                price=0,
+            )
+        ]
     )
 
 
 def new_discard(
     user: SortimentUser, product: Product, warehouse: Warehouse, quantity: int
-):
-    WarehouseEvent.objects.create(
-        user=user,
-        product=product,
-        warehouse=warehouse,
-        type=WarehouseEvent.EventType.DISCARD,
-        quantity=-quantity,
-        retail_price=0,
-        price=0,
+) -> bool:
+    """Returns False, without discarding anything, if the stock is too low."""
+    return record_events(
+        [
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=warehouse,
+                type=WarehouseEvent.EventType.DISCARD,
+                quantity=-quantity,
+                retail_price=0,
+                price=0,
+            )
+        ],
+        require_stock=True,
     )
 
 
@@ -70,22 +321,31 @@ def new_transfer(
     from_warehouse: Warehouse,
     to_warehouse: Warehouse,
     quantity: int,
-):
-    WarehouseEvent.objects.create(
-        user=user,
-        product=product,
-        warehouse=from_warehouse,
-        type=WarehouseEvent.EventType.TRANSFER_OUT,
-        quantity=-quantity,
-        retail_price=0,
-        price=product.price,
-    )
-    WarehouseEvent.objects.create(
-        user=user,
-        product=product,
-        warehouse=to_warehouse,
-        type=WarehouseEvent.EventType.TRANSFER_IN,
-        quantity=quantity,
-        retail_price=0,
-        price=product.price,
+) -> bool:
+    """
+    Returns False, without moving anything, if the source warehouse does not
+    hold enough pieces.
+    """
+    return record_events(
+        [
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=from_warehouse,
+                type=WarehouseEvent.EventType.TRANSFER_OUT,
+                quantity=-quantity,
+                retail_price=0,
+                price=product.price,
+            ),
+            WarehouseEvent(
+                user=user,
+                product=product,
+                warehouse=to_warehouse,
+                type=WarehouseEvent.EventType.TRANSFER_IN,
+                quantity=quantity,
+                retail_price=0,
+                price=product.price,
+            ),
+        ],
+        require_stock=True,
     )
@@ -0,0 +1,98 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+
+from sortiment.store.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# a request still unanswered after this long died with its worker
+IDEMPOTENCY_STALE_AFTER = timedelta(minutes=5)
+
+
+def get_idempotency_key(request: HttpRequest) -> str:
+    key = request.headers.get(IDEMPOTENCY_HEADER, "")
+    if not key:
+        key = request.POST.get("idempotency_key", "")
+    return key.strip()[:64]
+
+
+def get_idempotency_scope(request: HttpRequest) -> str:
+    """Keys are only valid for the user, or the session, that sent them."""
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    if request.session.session_key:
+        return f"session:{request.session.session_key}"
+    return ""
+
+
+def _replay(record: IdempotencyKey) -> HttpResponse:
+    response = HttpResponse(
+        bytes(record.body), status=record.status, content_type=record.content_type
+    )
+    if record.location:
+        response["Location"] = record.location
+    return response
+
+
+def _claim(scope: str, key: str, path: str) -> IdempotencyKey | None:
+    """
+    Stores a new record for the key, or returns None if the key is taken.
+    A record left unanswered by a dead worker is taken over.
+    """
+    stale = timezone.now() - IDEMPOTENCY_STALE_AFTER
+    IdempotencyKey.objects.filter(
+        scope=scope, key=key, status=None, created_at__lt=stale
+    ).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(scope=scope, key=key, path=path)
+    except IntegrityError:
+        return None
+
+
+class IdempotentMixin:
+    """
+    Makes POSTs that carry an idempotency key safe to retry: the response of
+    the first request is stored and replayed for retries from the same user
+    or session without running the view again. Must come after the access
+    mixins, so only permitted requests claim keys or get replays. A checkout
+    retried after it logged the user out is sent to the login instead.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        key = get_idempotency_key(request)
+        scope = get_idempotency_scope(request)
+        if request.method != "POST" or not key or not scope:
+            return super().dispatch(request, *args, **kwargs)
+
+        record = _claim(scope, key, request.path)
+        if record is None:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None or record.path != request.path:
+                return HttpResponse(status=422)
+            if record.status is None:
+                # the first request is still being handled
+                return HttpResponse(status=409)
+            return _replay(record)
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        except BaseException:
+            record.delete()
+            raise
+
+        if response.status_code >= 500 or response.streaming:
+            record.delete()
+            return response
+
+        record.status = response.status_code
+        record.content_type = response.get("Content-Type", "")
+        record.location = response.get("Location", "")
+        record.body = response.content
+        record.save(update_fields=["status", "content_type", "location", "body"])
+        return response
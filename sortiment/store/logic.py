@@ -1,14 +1,22 @@
+import heapq
 from collections import defaultdict
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Iterable
+from datetime import datetime
+from typing import Iterable, Mapping
 
 from django.contrib.auth.models import User
-from django.db.models import F, FloatField, Max, Q, Sum
-from django.db.models.functions import ExtractDay
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
-from sortiment.store.models import Product, Warehouse, WarehouseEvent, WarehouseState
+from sortiment.store.catalog import get_catalog
+from sortiment.store.models import (
+    Product,
+    ProductPopularity,
+    UserProductPopularity,
+    Warehouse,
+    WarehouseEvent,
+)
 
 
 @dataclass
@@ -20,19 +28,20 @@ class InventoryQuantities:
 def get_inventory_quantities(warehouse: Warehouse) -> dict[int, InventoryQuantities]:
     quantities = defaultdict(lambda: InventoryQuantities(0, 0))
 
-    states = WarehouseState.objects.values("product_id").annotate(
-        local=Sum("quantity", filter=Q(warehouse=warehouse), default=0),
-        total=Sum("quantity"),
-    )
-
-    for state in states:
-        quantities[state["product_id"]] = InventoryQuantities(
-            state["local"], state["total"]
-        )
+    catalog = get_catalog()
+    local = catalog.local_stock(warehouse.id)
+    for product_id, total in catalog.total_stock.items():
+        quantities[product_id] = InventoryQuantities(local.get(product_id, 0), total)
 
     return quantities
 
 
+RANKING_TIMEOUT = 15 * 60
+
+# purchase statistics are shared by all workers, unlike the catalog snapshot
+ranking_cache = caches["shared"]
+
+
 @dataclass
 class PurchaseStats:
     global_priority: float = 0
@@ -40,64 +49,126 @@ class PurchaseStats:
     last_purchase: datetime = datetime.min
 
 
-def get_purchases(warehouse: Warehouse, user: User) -> dict[int, PurchaseStats]:
-    purchases = defaultdict(lambda: PurchaseStats())
+def _ranking_key(warehouse: Warehouse, user: User) -> str:
+    """
+    Cache key of the purchase statistics of the user. It only changes with the
+    products, read from the catalog snapshot, not with every purchase. New
+    purchases show up when the entry expires or when the user logs in again,
+    see `precompute_ranking`.
+    """
+    return f"{warehouse.id}:{user.id}:{get_catalog().catalog_version}"
 
-    cutoff = timezone.now() - timedelta(days=60)
 
-    events = (
-        WarehouseEvent.objects.filter(
-            warehouse=warehouse,
-            type=WarehouseEvent.EventType.PURCHASE,
-            timestamp__gte=cutoff,
-        )
-        .values("product_id")
-        .annotate(
-            global_priority=Sum(
-                -F("quantity")
-                * 0.95 ** ExtractDay(timezone.now().date() - F("timestamp")),
-                output_field=FloatField(),
-            ),
-            user_priority=Sum(
-                -F("quantity")
-                * 0.95 ** ExtractDay(timezone.now().date() - F("timestamp")),
-                output_field=FloatField(),
-                filter=Q(user=user),
-                default=0,
-            ),
-            last_purchase=Max("timestamp"),
-        )
-    )
+def get_purchases(
+    warehouse: Warehouse, user: User, refresh: bool = False
+) -> dict[int, PurchaseStats]:
+    """Purchase statistics, cached for `RANKING_TIMEOUT` seconds."""
+    key = f"purchases:{_ranking_key(warehouse, user)}"
+    purchases = None if refresh else ranking_cache.get(key)
+    if purchases is None:
+        purchases = _load_purchases(warehouse, user)
+        ranking_cache.set(key, purchases, RANKING_TIMEOUT)
+    return defaultdict(PurchaseStats, purchases)
+
 
-    for event in events:
-        purchases[event["product_id"]] = PurchaseStats(
-            event["global_priority"], event["user_priority"], event["last_purchase"]
+def _load_purchases(warehouse: Warehouse, user: User) -> dict[int, PurchaseStats]:
+    purchases: dict[int, PurchaseStats] = {}
+    now = timezone.now()
+
+    for score in ProductPopularity.objects.filter(warehouse=warehouse):
+        purchases[score.product_id] = PurchaseStats(
+            score.score_at(now), 0, score.last_purchase
         )
 
+    for score in UserProductPopularity.objects.filter(warehouse=warehouse, user=user):
+        purchases.setdefault(
+            score.product_id, PurchaseStats()
+        ).user_priority = score.score_at(now)
+
     return purchases
 
 
+def add_popularity(warehouse: Warehouse, user: User, quantities: dict[int, int]):
+    """
+    Adds purchased quantities (product id -> pieces) to popularity scores once
+    the surrounding transaction commits. The score rows are locked only for
+    that short update, so checkouts of the same product do not queue up on
+    them.
+    """
+    quantities = dict(quantities)
+    transaction.on_commit(
+        lambda: _add_popularity(warehouse, user, quantities), robust=True
+    )
+
+
+def _add_popularity(warehouse: Warehouse, user: User, quantities: dict[int, int]):
+    try:
+        with transaction.atomic():
+            _update_popularity(warehouse, user, quantities)
+    except IntegrityError:
+        # another purchase created the same new score first
+        with transaction.atomic():
+            _update_popularity(warehouse, user, quantities)
+
+
+def _update_popularity(warehouse: Warehouse, user: User, quantities: dict[int, int]):
+    now = timezone.now()
+    scores = [(ProductPopularity, {})]
+    if user:
+        scores.append((UserProductPopularity, {"user": user}))
+
+    for model, lookup in scores:
+        existing = {
+            s.product_id: s
+            for s in model.objects.select_for_update().filter(
+                warehouse=warehouse, product_id__in=quantities, **lookup
+            )
+        }
+        created = []
+        for product_id, quantity in quantities.items():
+            score = existing.get(product_id)
+            if score is None:
+                score = model(
+                    warehouse=warehouse,
+                    product_id=product_id,
+                    **lookup,
+                    updated_at=now,
+                    last_purchase=now,
+                )
+                created.append(score)
+            score.add(quantity, now)
+
+        model.objects.bulk_update(
+            existing.values(), ["score", "updated_at", "last_purchase"]
+        )
+        model.objects.bulk_create(created)
+
+
 @dataclass
 class AnnotatedProduct:
     product: Product
     stats: PurchaseStats
     local_quantity: int = 0
     total_quantity: int = 0
+    relevance: float = 0
 
 
 def get_priority_value(e: WarehouseEvent):
     return -e.quantity * 0.95 ** (timezone.now() - e.timestamp).days
 
 
-def annotate_products(
-    products: Iterable[Product], warehouse: Warehouse, user: User
+def _annotate(
+    products: Iterable[Product],
+    quantities: dict[int, InventoryQuantities],
+    purchases: dict[int, PurchaseStats],
+    relevance: Mapping[int, float] | None = None,
 ) -> list[AnnotatedProduct]:
-    quantities = get_inventory_quantities(warehouse)
-    purchases = get_purchases(warehouse, user)
-
     annotated: list[AnnotatedProduct] = []
     for p in products:
         ap = AnnotatedProduct(p, purchases[p.id])
+        if relevance:
+            # coarse buckets, so purchase history still orders similar matches
+            ap.relevance = round(relevance.get(p.id, 0), 1)
 
         if not p.is_unlimited:
             ap.local_quantity = quantities[p.id].local
@@ -107,16 +178,29 @@ def annotate_products(
     return annotated
 
 
-def product_sort_key(p: AnnotatedProduct):
+def annotate_products(
+    products: Iterable[Product],
+    warehouse: Warehouse,
+    user: User,
+    relevance: Mapping[int, float] | None = None,
+) -> list[AnnotatedProduct]:
+    quantities = get_inventory_quantities(warehouse)
+    purchases = get_purchases(warehouse, user)
+    return _annotate(products, quantities, purchases, relevance)
+
+
+def _availability(p: AnnotatedProduct) -> int:
     if p.product.is_unlimited or p.local_quantity > 0:
-        availability = 1
+        return 1
     elif p.total_quantity > 0:
-        availability = 0
-    else:
-        availability = -1
+        return 0
+    return -1
+
 
+def product_sort_key(p: AnnotatedProduct):
     return (
-        availability,
+        _availability(p),
+        p.relevance,
         p.stats.user_priority,
         p.stats.global_priority,
         p.stats.last_purchase,
@@ -125,7 +209,81 @@ def product_sort_key(p: AnnotatedProduct):
 
 
 def get_product_list(
-    products: Iterable[Product], warehouse: Warehouse, user: User
+    products: Iterable[Product],
+    warehouse: Warehouse,
+    user: User,
+    relevance: Mapping[int, float] | None = None,
+    limit: int | None = None,
 ) -> list[AnnotatedProduct]:
-    annotated = annotate_products(products, warehouse, user)
+    """
+    Annotates and orders the products for the storefront. With `limit`, only
+    the best `limit` products are selected instead of sorting all of them.
+    """
+    annotated = annotate_products(products, warehouse, user, relevance)
+    if limit is not None:
+        return heapq.nlargest(limit, annotated, key=product_sort_key)
     return sorted(annotated, key=product_sort_key, reverse=True)
+
+
+def get_ranked_product_ids(
+    warehouse: Warehouse, user: User, refresh: bool = False
+) -> list[int]:
+    """
+    Returns ids of all listed products in storefront order for the given user.
+
+    The order by purchase history is cached like the purchase statistics,
+    `refresh` computes it again. Stock only moves products between
+    availability groups and is applied on every call.
+    """
+    catalog = get_catalog()
+    key = f"ranking:{_ranking_key(warehouse, user)}"
+    ranked = None if refresh else ranking_cache.get(key)
+    if ranked is None:
+        annotated = _annotate(
+            catalog.listed,
+            get_inventory_quantities(warehouse),
+            get_purchases(warehouse, user, refresh=refresh),
+        )
+        annotated.sort(key=lambda p: product_sort_key(p)[1:], reverse=True)
+        ranked = [p.product.id for p in annotated]
+        ranking_cache.set(key, ranked, RANKING_TIMEOUT)
+
+    quantities = get_inventory_quantities(warehouse)
+    products = [catalog.products[i] for i in ranked if i in catalog.products]
+    annotated = _annotate(products, quantities, defaultdict(PurchaseStats))
+    # sorting is stable, so the purchase order holds within each group
+    annotated.sort(key=_availability, reverse=True)
+    return [p.product.id for p in annotated]
+
+
+def get_ranked_product_list(
+    products: Iterable[Product],
+    warehouse: Warehouse,
+    user: User,
+    limit: int | None = None,
+) -> list[AnnotatedProduct]:
+    """
+    Same as `get_product_list`, but orders the products by the cached ranking
+    instead of recomputing purchase statistics.
+    """
+    ranked = get_ranked_product_ids(warehouse, user)
+    position = {product_id: i for i, product_id in enumerate(ranked)}
+
+    quantities = get_inventory_quantities(warehouse)
+    annotated = _annotate(products, quantities, defaultdict(lambda: PurchaseStats()))
+
+    def key(p: AnnotatedProduct):
+        return position.get(p.product.id, len(position))
+
+    if limit is not None:
+        return heapq.nsmallest(limit, annotated, key=key)
+    return sorted(annotated, key=key)
+
+
+def precompute_ranking(warehouse: Warehouse, user: User):
+    """
+    Ranks the products for the user right after login, so the storefront
+    pages of any worker read it from the shared cache, including the user's
+    purchases since the entry was last computed.
+    """
+    get_ranked_product_ids(warehouse, user, refresh=True)
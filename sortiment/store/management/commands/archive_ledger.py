@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from sortiment.store.models import (
+    ArchivedWarehouseEvent,
+    EventSummary,
+    StockCheckpoint,
+    WarehouseEvent,
+)
+from sortiment.store.partitions import add_months, drop_partitions_before
+from sortiment.users.models import ArchivedCreditLog, CreditCheckpoint, CreditLog
+
+# the longest window of the stats views is a year
+MIN_MONTHS = 13
+
+
+def _move(
+    source: type[models.Model], target: type[models.Model], horizon: datetime
+) -> int:
+    """Moves the rows of `source` older than `horizon` into `target`."""
+    q = connection.ops.quote_name
+    columns = ", ".join(q(f.column) for f in target._meta.concrete_fields)
+    with connection.cursor() as cursor:
+        # the ORM cannot copy rows between tables, hence raw SQL
+        cursor.execute(
+            f"""
+            INSERT INTO {q(target._meta.db_table)} ({columns})
+            SELECT {columns} FROM {q(source._meta.db_table)} WHERE "timestamp" < %s
+            """,
+            [horizon],
+        )
+        moved = cursor.rowcount
+
+    drop_partitions_before(source._meta.db_table, horizon)
+    source.objects.filter(timestamp__lt=horizon).delete()
+    return moved
+
+
+def summarize_events(horizon: datetime):
+    rows = (
+        WarehouseEvent.objects.filter(timestamp__lt=horizon)
+        .annotate(month=TruncMonth("timestamp", output_field=DateField()))
+        .values("warehouse_id", "product_id", "user_id", "type", "month")
+        .annotate(q=Sum("quantity"), p=Sum(F("price") * F("quantity")))
+    )
+    EventSummary.objects.bulk_create(
+        (
+            EventSummary(
+                warehouse_id=row["warehouse_id"],
+                product_id=row["product_id"],
+                user_id=row["user_id"],
+                type=row["type"],
+                month=row["month"],
+                quantity=row["q"],
+                total_price=row["p"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves events and credit logs older than the retention horizon to the "
+        "archive tables and leaves monthly summaries for the stats behind. "
+        "Checkpoints are taken first, so later replays skip the archive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=MIN_MONTHS,
+            help="Number of whole months, besides the current one, to keep.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if options["months"] < MIN_MONTHS:
+            raise CommandError(f"Stats need at least {MIN_MONTHS} months of history.")
+
+        this_month = timezone.localdate().replace(day=1)
+        horizon = timezone.make_aware(
+            datetime.combine(
+                add_months(this_month, -options["months"]), datetime.min.time()
+            )
+        )
+
+        # replays start at the latest checkpoint, these cover every archived row
+        StockCheckpoint.take()
+        CreditCheckpoint.take()
+
+        summarize_events(horizon)
+        events = _move(WarehouseEvent, ArchivedWarehouseEvent, horizon)
+        logs = _move(CreditLog, ArchivedCreditLog, horizon)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {events} events and {logs} credit logs "
+                f"older than {horizon:%d.%m.%Y}."
+            )
+        )
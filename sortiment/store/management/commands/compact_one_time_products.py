@@ -0,0 +1,64 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from sortiment.store.models import (
+    ArchivedWarehouseEvent,
+    CatalogVersion,
+    EventSummary,
+    Product,
+    QueuedCheckout,
+    StockCheckpoint,
+    WarehouseEvent,
+    WarehouseState,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds one-time products created for every scanned price into the "
+        "shared one-time product."
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        canonical = Product.get_one_time_product()
+        dummies = Product.objects.filter(is_dummy=True).exclude(pk=canonical.pk)
+        # one-time checkouts keep adding to the canonical row meanwhile; the
+        # stock goes first, flushers lock it before they delete from the queue
+        WarehouseState.lock()
+        # products of queued checkouts must stay until the checkouts are
+        # written; the queryset delete below skips Product.delete, so no new
+        # checkouts may be queued until the end
+        QueuedCheckout.lock()
+        dummies = dummies.exclude(pk__in=QueuedCheckout.product_ids())
+        ids = list(dummies.values_list("id", flat=True))
+        if not ids:
+            self.stdout.write("Nothing to compact.")
+            return
+
+        # events keep their own prices, only the product reference changes
+        events = WarehouseEvent.objects.filter(product_id__in=ids).update(
+            product=canonical
+        )
+        for model in (ArchivedWarehouseEvent, EventSummary):
+            model.objects.filter(product_id__in=ids).update(product=canonical)
+
+        stock: dict[tuple[int, int], list] = {}
+        for (w, _), (quantity, total_price) in WarehouseState.current_stock(
+            product_id__in=ids
+        ).items():
+            row = stock.setdefault((w, canonical.id), [0, 0])
+            row[0] += quantity
+            row[1] += total_price
+        WarehouseState.add_stock(stock)
+
+        dummies.delete()
+        CatalogVersion.bump(catalog=True)
+        # checkpoints held the folded products separately
+        StockCheckpoint.take()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Folded {len(ids)} one-time products and {events} events."
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from sortiment.store.partitions import create_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the monthly partitions of the event and credit logs ahead of "
+        "time. Meant to run periodically, e.g. daily. PostgreSQL only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=3,
+            help="Number of months ahead to create partitions for.",
+        )
+
+    def handle(self, *args, **options):
+        created = create_partitions(options["months"])
+        for name in created:
+            self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partitions."))
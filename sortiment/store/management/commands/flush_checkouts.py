@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from sortiment.store.helpers.events import flush_receipts
+from sortiment.store.models import QueuedCheckout
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes checkouts queued in write-behind mode. Workers flush them on "
+        "their own, this picks up whatever a stopped worker left behind."
+    )
+
+    def handle(self, *args, **options):
+        total = 0
+        while flushed := flush_receipts():
+            total += flushed
+        self.stdout.write(self.style.SUCCESS(f"Flushed {total} checkouts."))
+
+        failed = QueuedCheckout.objects.exclude(failed_at=None).count()
+        if failed:
+            self.stderr.write(f"{failed} checkouts failed, see the admin.")
@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from sortiment.store.models import WarehouseState
+
+
+class Command(BaseCommand):
+    help = (
+        "Merges the stock shards of products with sharded stock into their "
+        "warehouse states. Meant to run periodically, e.g. every minute."
+    )
+
+    def handle(self, *args, **options):
+        folded = WarehouseState.fold_shards()
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} stock shards."))
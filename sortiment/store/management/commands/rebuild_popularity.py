@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from sortiment.store.models import (
+    ProductPopularity,
+    UserProductPopularity,
+    WarehouseEvent,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuilds product popularity scores from the purchase history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=60,
+            help="Only replay purchases from the last N days.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        products: dict[tuple[int, int], ProductPopularity] = {}
+        users: dict[tuple[int, int, int], UserProductPopularity] = {}
+
+        events = (
+            WarehouseEvent.objects.filter(
+                type=WarehouseEvent.EventType.PURCHASE, timestamp__gte=cutoff
+            )
+            .order_by("timestamp")
+            .values_list(
+                "warehouse_id", "product_id", "user_id", "quantity", "timestamp"
+            )
+        )
+
+        for warehouse_id, product_id, user_id, quantity, timestamp in events.iterator():
+            key = (warehouse_id, product_id)
+            if key not in products:
+                products[key] = ProductPopularity(
+                    warehouse_id=warehouse_id,
+                    product_id=product_id,
+                    updated_at=timestamp,
+                    last_purchase=timestamp,
+                )
+            products[key].add(-quantity, timestamp)
+
+            if user_id is None:
+                continue
+            user_key = (warehouse_id, product_id, user_id)
+            if user_key not in users:
+                users[user_key] = UserProductPopularity(
+                    warehouse_id=warehouse_id,
+                    product_id=product_id,
+                    user_id=user_id,
+                    updated_at=timestamp,
+                    last_purchase=timestamp,
+                )
+            users[user_key].add(-quantity, timestamp)
+
+        ProductPopularity.objects.all().delete()
+        UserProductPopularity.objects.all().delete()
+        ProductPopularity.objects.bulk_create(products.values(), batch_size=1000)
+        UserProductPopularity.objects.bulk_create(users.values(), batch_size=1000)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {len(products)} product and {len(users)} user scores."
+            )
+        )
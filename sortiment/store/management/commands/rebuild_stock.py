@@ -0,0 +1,213 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Iterable
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from sortiment.store.models import (
+    ArchivedWarehouseEvent,
+    StockCheckpoint,
+    Warehouse,
+    WarehouseEvent,
+    WarehouseState,
+)
+
+Stock = dict[int, tuple[int, Decimal]]
+
+
+@dataclass
+class Difference:
+    warehouse: Warehouse
+    product_id: int
+    live: tuple[int, Decimal]
+    expected: tuple[int, Decimal]
+
+
+def _add(stock: Stock, rows):
+    for product_id, quantity, total_price in rows:
+        q, p = stock.get(product_id, (0, Decimal(0)))
+        stock[product_id] = (q + quantity, p + total_price)
+
+
+def expected_stock(
+    warehouse: Warehouse,
+    checkpoint: StockCheckpoint | None,
+    product_ids: Iterable[int] | None = None,
+) -> Stock:
+    """
+    Stock of the checkpoint plus all later events, summed by the database.
+    With `product_ids`, only those products are summed.
+    """
+    filters = {"warehouse": warehouse}
+    if product_ids is not None:
+        filters["product_id__in"] = list(product_ids)
+
+    stock: Stock = {}
+    if checkpoint:
+        _add(
+            stock,
+            checkpoint.rows.filter(**filters).values_list(
+                "product_id", "quantity", "total_price"
+            ),
+        )
+
+    for model in (WarehouseEvent, ArchivedWarehouseEvent):
+        events = model.objects.filter(**filters)
+        if checkpoint:
+            events = events.filter(id__gt=checkpoint.last_event_id)
+        _add(
+            stock,
+            events.values("product_id")
+            .annotate(q=Sum("quantity"), p=Sum(F("price") * F("quantity")))
+            .values_list("product_id", "q", "p"),
+        )
+    return stock
+
+
+def live_stock(warehouse: Warehouse, product_ids: Iterable[int] | None = None) -> Stock:
+    filters = {"warehouse": warehouse}
+    if product_ids is not None:
+        filters["product_id__in"] = list(product_ids)
+    return {
+        product_id: tuple(row)
+        for (_, product_id), row in WarehouseState.current_stock(**filters).items()
+    }
+
+
+def compare(warehouse: Warehouse, expected: Stock, live: Stock) -> list[Difference]:
+    return [
+        Difference(
+            warehouse,
+            product_id,
+            live.get(product_id, (0, Decimal(0))),
+            expected.get(product_id, (0, Decimal(0))),
+        )
+        for product_id in sorted(expected.keys() | live.keys())
+        if live.get(product_id, (0, 0)) != expected.get(product_id, (0, 0))
+    ]
+
+
+@transaction.atomic
+def repair(
+    differences: list[Difference], checkpoint: StockCheckpoint | None
+) -> list[Difference]:
+    """
+    Fixes the differing stock rows under a single lock and returns what was
+    fixed. The differences were found in an older snapshot, so the rows are
+    recomputed under the lock before their differences are added.
+    """
+    WarehouseState.lock()
+
+    warehouses: dict[int, Warehouse] = {}
+    product_ids: dict[int, set[int]] = defaultdict(set)
+    for d in differences:
+        warehouses[d.warehouse.id] = d.warehouse
+        product_ids[d.warehouse.id].add(d.product_id)
+
+    repaired = []
+    for warehouse_id, ids in product_ids.items():
+        warehouse = warehouses[warehouse_id]
+        repaired += compare(
+            warehouse,
+            expected_stock(warehouse, checkpoint, ids),
+            live_stock(warehouse, ids),
+        )
+
+    WarehouseState.add_stock(
+        {
+            (d.warehouse.id, d.product_id): [
+                d.expected[0] - d.live[0],
+                d.expected[1] - d.live[1],
+            ]
+            for d in repaired
+        }
+    )
+    return repaired
+
+
+def check_warehouse(
+    warehouse: Warehouse, checkpoint: StockCheckpoint | None
+) -> list[Difference]:
+    """
+    Compares the stock of one warehouse with the event log. Runs in its own
+    thread and a transaction with a consistent snapshot, without locks.
+    """
+    try:
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+            return compare(
+                warehouse, expected_stock(warehouse, checkpoint), live_stock(warehouse)
+            )
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the stock of every warehouse from the event log, starting "
+        "at the latest checkpoint, and compares it with the live stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Overwrite stock that differs with the recomputed values.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            action="store_true",
+            help="Save a checkpoint once the stock matches the event log.",
+        )
+        parser.add_argument(
+            "--from-scratch",
+            action="store_true",
+            help="Replay the whole event log. Prices set by a reset without "
+            "events will show up as differences.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of warehouses checked in parallel.",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = None
+        if not options["from_scratch"]:
+            checkpoint = StockCheckpoint.objects.order_by("-id").first()
+
+        warehouses = list(Warehouse.objects.all())
+        workers = max(options["workers"], 1)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(lambda w: check_warehouse(w, checkpoint), warehouses)
+            differences = [d for result in results for d in result]
+
+        if options["repair"] and differences:
+            differences = repair(differences, checkpoint)
+
+        for d in differences:
+            self.stdout.write(
+                f"{d.warehouse}; product {d.product_id}: "
+                f"{d.live[0]} ks / {d.live[1]} € in stock, "
+                f"{d.expected[0]} ks / {d.expected[1]} € from events"
+            )
+
+        if differences and not options["repair"]:
+            raise CommandError(f"{len(differences)} stock rows differ.")
+
+        if options["checkpoint"]:
+            StockCheckpoint.take()
+        if differences:
+            message = f"Repaired {len(differences)} stock rows."
+        else:
+            message = f"Stock of {len(warehouses)} warehouses matches the events."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,87 @@
+import ipaddress
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from ipware import get_client_ip
+
+from sortiment.store.models import Terminal
+
+TERMINAL_INDEX_TTL = 60
+
+
+class TerminalIndex:
+    """
+    Longest-prefix match of client addresses to terminals.
+
+    Terminals are grouped by prefix length, so a lookup is one dictionary
+    access per distinct prefix length instead of a scan of all networks.
+    """
+
+    def __init__(self, terminals: Iterable[Terminal]):
+        self.built_at = time.monotonic()
+        self._tables: dict[tuple[int, int], dict[int, Terminal]] = defaultdict(dict)
+        for terminal in terminals:
+            network = ipaddress.ip_network(terminal.network, strict=False)
+            key = (network.version, network.prefixlen)
+            self._tables[key][int(network.network_address)] = terminal
+        self._prefixes = sorted(self._tables, key=lambda k: k[1], reverse=True)
+
+    def lookup(self, ip: str) -> Terminal | None:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        value = int(address)
+        for version, prefixlen in self._prefixes:
+            if version != address.version:
+                continue
+            host_bits = address.max_prefixlen - prefixlen
+            terminal = self._tables[(version, prefixlen)].get(
+                value >> host_bits << host_bits
+            )
+            if terminal:
+                return terminal
+        return None
+
+
+_index: TerminalIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_terminal_index() -> TerminalIndex:
+    """
+    Returns the terminal index of this worker. Terminal changes rebuild it
+    right away in the worker that made them and within `TERMINAL_INDEX_TTL`
+    seconds everywhere else.
+    """
+    global _index
+
+    index = _index
+    if index is not None and time.monotonic() - index.built_at < TERMINAL_INDEX_TTL:
+        return index
+
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.built_at >= TERMINAL_INDEX_TTL:
+            _index = TerminalIndex(Terminal.objects.select_related("warehouse"))
+        return _index
+
+
+def invalidate_terminal_index():
+    global _index
+    _index = None
+
+
+class TerminalMiddleware:
+    """Sets `request.terminal` and `request.warehouse` from the client IP."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        ip, _ = get_client_ip(request)
+        request.terminal = get_terminal_index().lookup(ip) if ip else None
+        request.warehouse = request.terminal.warehouse if request.terminal else None
+        return self.get_response(request)
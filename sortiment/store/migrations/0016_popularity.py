@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0015_auto_20240703_2338"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductPopularity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField(default=0, verbose_name="skóre")),
+                ("updated_at", models.DateTimeField(verbose_name="aktualizované")),
+                ("last_purchase", models.DateTimeField(verbose_name="posledný nákup")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("warehouse", "product"),
+                        name="popularity_wh_prod_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="UserProductPopularity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField(default=0, verbose_name="skóre")),
+                ("updated_at", models.DateTimeField(verbose_name="aktualizované")),
+                ("last_purchase", models.DateTimeField(verbose_name="posledný nákup")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="používateľ",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("warehouse", "product", "user"),
+                        name="popularity_wh_prod_user_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:29
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    CatalogVersion = apps.get_model("store", "CatalogVersion")
+    CatalogVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0016_popularity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:31
+
+import unicodedata
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def fill_search_name(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    products = list(Product.objects.all())
+    for product in products:
+        decomposed = unicodedata.normalize("NFKD", product.name)
+        product.search_name = "".join(
+            c for c in decomposed if not unicodedata.combining(c)
+        ).lower()
+    Product.objects.bulk_update(products, ["search_name"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0017_catalogversion"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="product",
+            name="search_name",
+            field=models.CharField(default="", editable=False, max_length=128),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_name"],
+                name="product_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0018_product_search_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="version",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="warehousestate",
+            name="version",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:36
+
+import ipaddress
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import sortiment.store.models
+
+
+def create_terminals(apps, schema_editor):
+    Warehouse = apps.get_model("store", "Warehouse")
+    Terminal = apps.get_model("store", "Terminal")
+    for warehouse in Warehouse.objects.all():
+        Terminal.objects.create(
+            name=warehouse.name,
+            warehouse=warehouse,
+            network=str(ipaddress.ip_network(warehouse.ip)),
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0019_catalog_row_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Terminal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=32, verbose_name="názov")),
+                (
+                    "network",
+                    models.CharField(
+                        max_length=43,
+                        unique=True,
+                        validators=[sortiment.store.models.validate_network],
+                        verbose_name="IP adresa alebo sieť",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="terminals",
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_terminals, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="warehouse",
+            name="ip",
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_one_time_product(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Product.objects.get_or_create(
+        barcode="555555",
+        defaults={
+            "name": "Jednorazová položka",
+            "search_name": "jednorazova polozka",
+            "price": 0,
+            "is_unlimited": True,
+            "is_dummy": True,
+        },
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0020_terminal"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_one_time_product, migrations.RunPython.noop),
+    ]
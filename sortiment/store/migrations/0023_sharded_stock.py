@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0022_receipt"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="sharded_stock",
+            field=models.BooleanField(
+                default=False,
+                help_text="Pre často kupované produkty: nákupy si nečakajú na jeden riadok skladu, stav sa zlučuje priebežne.",
+                verbose_name="rozdelený sklad",
+            ),
+        ),
+        migrations.CreateModel(
+            name="WarehouseStateShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("quantity", models.IntegerField(default=0, verbose_name="počet")),
+                (
+                    "total_price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=16,
+                        verbose_name="skladová cena",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("warehouse", "product", "shard"),
+                        name="whshard_wh_prod_shard_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0025_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="vytvorené"),
+                ),
+                (
+                    "last_event_id",
+                    models.BigIntegerField(verbose_name="posledný doklad"),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StockCheckpointRow",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.IntegerField(verbose_name="počet")),
+                (
+                    "total_price",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=16, verbose_name="skladová cena"
+                    ),
+                ),
+                (
+                    "checkpoint",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rows",
+                        to="store.stockcheckpoint",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+        ),
+    ]
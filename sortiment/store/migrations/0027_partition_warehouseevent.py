@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from sortiment.store.partitions import partition_table
+
+
+def partition_events(apps, schema_editor):
+    partition_table(apps.get_model("store", "WarehouseEvent"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0026_stock_checkpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,150 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0027_partition_warehouseevent"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedWarehouseEvent",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "type",
+                    models.IntegerField(
+                        choices=[
+                            (0, "import"),
+                            (1, "purchase"),
+                            (2, "transfer in"),
+                            (3, "transfer out"),
+                            (4, "discard"),
+                            (5, "correction"),
+                        ],
+                        verbose_name="typ dokladu",
+                    ),
+                ),
+                ("quantity", models.IntegerField(verbose_name="počet")),
+                (
+                    "price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=6,
+                        verbose_name="skladová cena / ks",
+                    ),
+                ),
+                (
+                    "retail_price",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=5,
+                        verbose_name="odbytová cena / ks",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(verbose_name="dátum a čas")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+                (
+                    "receipt",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="store.receipt",
+                        verbose_name="nákup",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="používateľ",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="EventSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "type",
+                    models.IntegerField(
+                        choices=[
+                            (0, "import"),
+                            (1, "purchase"),
+                            (2, "transfer in"),
+                            (3, "transfer out"),
+                            (4, "discard"),
+                            (5, "correction"),
+                        ],
+                        verbose_name="typ dokladu",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="mesiac")),
+                ("quantity", models.IntegerField(verbose_name="počet")),
+                (
+                    "total_price",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=16, verbose_name="skladová cena"
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="používateľ",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+        ),
+    ]
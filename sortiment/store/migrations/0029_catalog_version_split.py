@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0028_archivedwarehouseevent_eventsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalogversion",
+            name="catalog_version",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="warehousestate",
+            name="version",
+            field=models.BigIntegerField(db_default=0, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0029_catalog_version_split"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="warehousestateshard",
+            name="version",
+            field=models.BigIntegerField(db_default=0, default=0, editable=False),
+        ),
+    ]
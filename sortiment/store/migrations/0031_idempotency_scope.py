@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0030_warehousestateshard_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="scope",
+            field=models.CharField(default="", max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="idempotencykey",
+            name="key",
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="idempotencykey",
+            constraint=models.UniqueConstraint(
+                fields=("scope", "key"), name="idempotency_scope_key_unique"
+            ),
+        ),
+    ]
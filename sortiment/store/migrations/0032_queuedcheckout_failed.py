@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0031_idempotency_scope"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="queuedcheckout",
+            name="error",
+            field=models.TextField(blank=True, verbose_name="chyba"),
+        ),
+        migrations.AddField(
+            model_name="queuedcheckout",
+            name="failed_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="zlyhané"),
+        ),
+    ]
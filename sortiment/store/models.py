@@ -1,45 +1,159 @@
+import ipaddress
+import random
+import unicodedata
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable
+
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+from django.db.models import Case, F, ProtectedError, Q, Sum, When
+
+POPULARITY_DECAY = 0.95
+ONE_TIME_BARCODE = "555555"
+
+
+class CatalogVersion(models.Model):
+    """
+    Single-row counter bumped whenever products or stock change.
+
+    Changed products and stock rows are stamped with the new version, which
+    lets clients fetch only what changed since the version they already have.
+    `catalog_version` is the version of the last change to products or tags,
+    so stock changes alone do not invalidate everything derived from them.
+    """
+
+    version = models.BigIntegerField(default=0)
+    catalog_version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
+
+    @staticmethod
+    def current() -> int:
+        return CatalogVersion.current_versions()[0]
+
+    @staticmethod
+    def current_versions() -> tuple[int, int]:
+        """Returns the version and the catalog version."""
+        return CatalogVersion.objects.filter(pk=1).values_list(
+            "version", "catalog_version"
+        ).first() or (0, 0)
+
+    @staticmethod
+    def bump(*stamped: models.QuerySet, catalog: bool = False):
+        """
+        Once the current transaction commits, increments the version and
+        stamps the rows of the `stamped` querysets with it. `catalog` marks a
+        change of products or tags rather than of stock.
+
+        The version row is only locked by the short transaction doing the
+        increment, not for the whole transaction of the writer, so writers do
+        not queue behind each other. Versions still become visible in order,
+        together with their stamps.
+        """
+        transaction.on_commit(
+            lambda: CatalogVersion._increment(stamped, catalog), robust=True
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def _increment(stamped: tuple[models.QuerySet, ...], catalog: bool) -> int:
+        table = connection.ops.quote_name(CatalogVersion._meta.db_table)
+        updates = "version = version + 1"
+        if catalog:
+            updates += ", catalog_version = version + 1"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET {updates} WHERE id = 1 RETURNING version"
+            )
+            (version,) = cursor.fetchone()
+
+        for queryset in stamped:
+            queryset.update(version=version)
+        return version
 
 
 class Warehouse(models.Model):
     name = models.CharField(max_length=32)
-    ip = models.GenericIPAddressField(unique=True)
 
     def __str__(self):
         return self.name
 
     def get_products_price_for_sale_sum(self):
-        return sum(
-            state.quantity * state.product.price
-            for state in WarehouseState.objects.filter(warehouse=self, quantity__gt=0)
-            if not state.product.is_dummy and not state.product.is_unlimited
+        return Warehouse._stock_value(
+            WarehouseState.current_stock(warehouse=self), retail=True
         )
 
     def get_products_price_when_buy_sum(self):
-        return sum(
-            state.total_price
-            for state in WarehouseState.objects.filter(warehouse=self, quantity__gt=0)
-            if not state.product.is_dummy and not state.product.is_unlimited
+        return Warehouse._stock_value(
+            WarehouseState.current_stock(warehouse=self), retail=False
         )
 
     @staticmethod
     def get_global_products_price_for_sale_sum():
-        return sum(
-            state.quantity * state.product.price
-            for state in WarehouseState.objects.filter(quantity__gt=0)
-            if not state.product.is_dummy
-            and not state.product.is_unlimited
-            and state.quantity > 0
-        )
+        return Warehouse._stock_value(WarehouseState.current_stock(), retail=True)
 
     @staticmethod
     def get_global_products_price_when_buy_sum():
-        return sum(
-            state.total_price
-            for state in WarehouseState.objects.filter(quantity__gt=0)
-            if not state.product.is_dummy and not state.product.is_unlimited
-        )
+        return Warehouse._stock_value(WarehouseState.current_stock(), retail=False)
+
+    @staticmethod
+    def _stock_value(stock: dict[tuple[int, int], list], retail: bool):
+        products = Product.objects.in_bulk({p for _, p in stock})
+        total = 0
+        for (_, product_id), (quantity, total_price) in stock.items():
+            product = products[product_id]
+            if quantity <= 0 or product.is_dummy or product.is_unlimited:
+                continue
+            total += quantity * product.price if retail else total_price
+        return total
+
+
+def validate_network(value: str):
+    try:
+        ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        raise ValidationError("Zadaj IP adresu alebo sieť v tvare 10.0.0.0/24.")
+
+
+class Terminal(models.Model):
+    """A kiosk, recognized by its IP address or the network it is in."""
+
+    name = models.CharField(max_length=32, verbose_name="názov")
+    warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.CASCADE,
+        related_name="terminals",
+        verbose_name="sklad",
+    )
+    network = models.CharField(
+        max_length=43,
+        unique=True,
+        validators=[validate_network],
+        verbose_name="IP adresa alebo sieť",
+    )
+
+    def __str__(self):
+        return f"{self.name} ({self.network})"
+
+    def save(self, *args, **kwargs):
+        self.network = str(ipaddress.ip_network(self.network, strict=False))
+        super().save(*args, **kwargs)
+        Terminal.invalidate_index()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Terminal.invalidate_index()
+        return result
+
+    @staticmethod
+    def invalidate_index():
+        from sortiment.store.middleware import invalidate_terminal_index
+
+        invalidate_terminal_index()
 
 
 class Tag(models.Model):
@@ -48,6 +162,15 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        CatalogVersion.bump(catalog=True)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        CatalogVersion.bump(catalog=True)
+        return result
+
 
 class Product(models.Model):
     id: int
@@ -60,18 +183,65 @@ class Product(models.Model):
     is_unlimited = models.BooleanField(verbose_name="neobmedzený predmet")
     tags = models.ManyToManyField(Tag, blank=True, verbose_name="tagy")
     is_dummy = models.BooleanField(default=False, verbose_name="jednorazový predmet")
+    sharded_stock = models.BooleanField(
+        default=False,
+        verbose_name="rozdelený sklad",
+        help_text="Pre často kupované produkty: nákupy si nečakajú na jeden "
+        "riadok skladu, stav sa zlučuje priebežne.",
+    )
+    search_name = models.CharField(max_length=128, default="", editable=False)
+    version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=["search_name"],
+                name="product_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            )
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.price} €)"
 
+    def save(self, *args, **kwargs):
+        self.search_name = Product.normalize_name(self.name)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "search_name"}
+        super().save(*args, **kwargs)
+        CatalogVersion.bump(Product.objects.filter(pk=self.pk), catalog=True)
+
+    def delete(self, *args, **kwargs):
+        queued = QueuedCheckout.with_products([self.pk])
+        if queued:
+            # the queued lines only hold the id, their purchase would be lost
+            raise ProtectedError(
+                f"Produkt {self} čaká na zápis v {len(queued)} nákupoch.", queued
+            )
+        result = super().delete(*args, **kwargs)
+        CatalogVersion.bump(catalog=True)
+        return result
+
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        """Lowercases the name and strips diacritics, same as unaccent()."""
+        decomposed = unicodedata.normalize("NFKD", name)
+        return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
     @staticmethod
-    def generate_one_time_product(price, barcode):
-        product, created = Product.objects.get_or_create(
-            price=price,
-            name="Jednorazová položka",
-            is_unlimited=True,
-            barcode=barcode,
-            is_dummy=True,
+    def get_one_time_product() -> "Product":
+        """
+        Shared product behind all one-time items. The price of each item lives
+        on the cart line and on its purchase event instead.
+        """
+        product, _ = Product.objects.get_or_create(
+            barcode=ONE_TIME_BARCODE,
+            defaults={
+                "name": "Jednorazová položka",
+                "price": 0,
+                "is_unlimited": True,
+                "is_dummy": True,
+            },
         )
         return product
 
@@ -89,6 +259,7 @@ class WarehouseState(models.Model):
     total_price = models.DecimalField(
         max_digits=16, decimal_places=2, default=0, verbose_name="skladová cena"
     )
+    version = models.BigIntegerField(default=0, db_default=0, editable=False)
 
     class Meta:
         constraints = [
@@ -100,6 +271,397 @@ class WarehouseState(models.Model):
     def __str__(self):
         return f"{self.warehouse}; {self.product}; {self.quantity}"
 
+    @staticmethod
+    @transaction.atomic
+    def apply_events(
+        events: list["WarehouseEvent"], require_stock: bool = False
+    ) -> bool:
+        """
+        Adds the quantities and prices of events to the stock without reading
+        the state rows first.
+
+        Changes are written with one INSERT ... ON CONFLICT DO UPDATE; those
+        of products with sharded stock go to a random shard instead. With
+        `require_stock`, decrements are instead applied by a single UPDATE
+        that only matches rows holding enough pieces; if any of them is
+        refused, nothing is written and False is returned.
+        """
+        deltas: dict[tuple[int, int], list] = {}
+        shard_deltas: dict[tuple[int, int, int], list] = {}
+        for e in events:
+            key = (e.warehouse_id, e.product_id)
+            if e.product.sharded_stock and not require_stock:
+                target = shard_deltas
+                key += (random.randrange(settings.STOCK_SHARDS),)
+            else:
+                target = deltas
+            delta = target.setdefault(key, [0, 0])
+            delta[0] += e.quantity
+            delta[1] += e.price * e.quantity
+
+        if shard_deltas:
+            shard_keys = ("warehouse_id", "product_id", "shard")
+            _add_stock(WarehouseStateShard, shard_keys, shard_deltas)
+            # only the written shard, the others are left to other writers
+            CatalogVersion.bump(
+                _stock_rows(WarehouseStateShard, shard_deltas, shard_keys)
+            )
+        if not deltas:
+            return True
+
+        stamped = _stock_rows(WarehouseState, deltas)
+        if require_stock:
+            decrements = {k: v for k, v in deltas.items() if v[0] < 0}
+            deltas = {k: v for k, v in deltas.items() if v[0] >= 0}
+            WarehouseState.fold_shards(list(decrements))
+            if decrements and not WarehouseState._decrement(decrements):
+                transaction.set_rollback(True)
+                return False
+
+        if deltas:
+            _add_stock(WarehouseState, ("warehouse_id", "product_id"), deltas)
+        CatalogVersion.bump(stamped)
+        return True
+
+    @staticmethod
+    def current_stock(**filters) -> dict[tuple[int, int], list]:
+        """
+        [quantity, total price] of each (warehouse, product) matching
+        `filters`, including shard changes that were not folded yet.
+        """
+        stock: dict[tuple[int, int], list] = {}
+        for model in (WarehouseState, WarehouseStateShard):
+            rows = (
+                model.objects.filter(**filters)
+                .values("warehouse_id", "product_id")
+                .annotate(q=Sum("quantity"), p=Sum("total_price"))
+                .values_list("warehouse_id", "product_id", "q", "p")
+            )
+            for w, p, quantity, total_price in rows:
+                row = stock.setdefault((w, p), [0, Decimal(0)])
+                row[0] += quantity
+                row[1] += total_price
+        return stock
+
+    @staticmethod
+    def lock():
+        """
+        Blocks stock writes until the end of the current transaction. Every
+        writer updates the stock before inserting its events, so once the
+        lock is held the event log and the stock agree. PostgreSQL only.
+        """
+        if connection.vendor != "postgresql":
+            return
+        tables = ", ".join(
+            connection.ops.quote_name(m._meta.db_table)
+            for m in (WarehouseState, WarehouseStateShard)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {tables} IN EXCLUSIVE MODE")
+
+    @staticmethod
+    def _decrement(deltas: dict[tuple[int, int], list]) -> bool:
+        quantity_cases = []
+        price_cases = []
+        rows = Q()
+        for (w, p), (quantity, total_price) in deltas.items():
+            rows |= Q(warehouse_id=w, product_id=p, quantity__gte=-quantity)
+            quantity_cases.append(When(warehouse_id=w, product_id=p, then=quantity))
+            price_cases.append(When(warehouse_id=w, product_id=p, then=total_price))
+
+        updated = WarehouseState.objects.filter(rows).update(
+            quantity=F("quantity") + Case(*quantity_cases, default=0),
+            total_price=F("total_price")
+            + Case(*price_cases, default=0, output_field=models.DecimalField()),
+        )
+        return updated == len(deltas)
+
+    @staticmethod
+    @transaction.atomic
+    def fold_shards(keys: list[tuple[int, int]] | None = None) -> int:
+        """
+        Merges pending shard changes of the given (warehouse, product) pairs,
+        or of all products, into the state rows. Returns the number of
+        merged shards.
+        """
+        if keys is not None:
+            if not keys:
+                return 0
+            shards = _stock_rows(WarehouseStateShard, keys)
+        else:
+            shards = WarehouseStateShard.objects.all()
+        shards = shards.select_for_update()
+
+        shards = list(shards)
+        if not shards:
+            return 0
+
+        deltas: dict[tuple[int, int], list] = {}
+        for shard in shards:
+            delta = deltas.setdefault((shard.warehouse_id, shard.product_id), [0, 0])
+            delta[0] += shard.quantity
+            delta[1] += shard.total_price
+
+        WarehouseStateShard.objects.filter(id__in=[s.id for s in shards]).delete()
+        WarehouseState.add_stock(deltas)
+        return len(shards)
+
+    @staticmethod
+    def add_stock(deltas: dict[tuple[int, int], list]):
+        """
+        Adds [quantity, total price] deltas to the state rows of (warehouse,
+        product) pairs without recording events.
+        """
+        if not deltas:
+            return
+        _add_stock(WarehouseState, ("warehouse_id", "product_id"), deltas)
+        CatalogVersion.bump(_stock_rows(WarehouseState, deltas))
+
+
+class WarehouseStateShard(models.Model):
+    """
+    Pending stock change of a product with sharded stock. Purchases add to one
+    of `STOCK_SHARDS` rows picked at random instead of the single state row,
+    so concurrent checkouts of the same product do not wait for each other.
+    """
+
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    warehouse_id: int
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, verbose_name="produkt"
+    )
+    product_id: int
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0, verbose_name="počet")
+    total_price = models.DecimalField(
+        max_digits=16, decimal_places=2, default=0, verbose_name="skladová cena"
+    )
+    version = models.BigIntegerField(default=0, db_default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["warehouse", "product", "shard"],
+                name="whshard_wh_prod_shard_unique",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.product}; {self.shard}; {self.quantity}"
+
+
+class StockCheckpoint(models.Model):
+    """
+    Copy of the stock of all warehouses after event `last_event_id`. Stock
+    rebuilds start from the latest checkpoint and replay only later events.
+    """
+
+    KEEP = 7
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="vytvorené")
+    last_event_id = models.BigIntegerField(verbose_name="posledný doklad")
+
+    def __str__(self):
+        return f"{self.created_at}; {self.last_event_id}"
+
+    @staticmethod
+    @transaction.atomic
+    def take() -> "StockCheckpoint":
+        WarehouseState.lock()
+        WarehouseState.fold_shards()
+        last_event_id = max(
+            m.objects.aggregate(last=models.Max("id"))["last"] or 0
+            for m in (WarehouseEvent, ArchivedWarehouseEvent)
+        )
+        checkpoint = StockCheckpoint.objects.create(last_event_id=last_event_id)
+        StockCheckpointRow.objects.bulk_create(
+            StockCheckpointRow(
+                checkpoint=checkpoint,
+                warehouse_id=w,
+                product_id=p,
+                quantity=quantity,
+                total_price=total_price,
+            )
+            for w, p, quantity, total_price in WarehouseState.objects.values_list(
+                "warehouse_id", "product_id", "quantity", "total_price"
+            )
+        )
+
+        old = StockCheckpoint.objects.order_by("-id")[StockCheckpoint.KEEP :]
+        StockCheckpoint.objects.filter(id__in=old.values("id")).delete()
+        return checkpoint
+
+
+class StockCheckpointRow(models.Model):
+    checkpoint = models.ForeignKey(
+        StockCheckpoint, on_delete=models.CASCADE, related_name="rows"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    warehouse_id: int
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, verbose_name="produkt"
+    )
+    product_id: int
+    quantity = models.IntegerField(verbose_name="počet")
+    total_price = models.DecimalField(
+        max_digits=16, decimal_places=2, verbose_name="skladová cena"
+    )
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.product}; {self.quantity}"
+
+
+def _stock_rows(
+    model: type[models.Model],
+    keys,
+    fields: tuple[str, ...] = ("warehouse_id", "product_id"),
+) -> models.QuerySet:
+    """Rows of `model` with the given values of the `fields` columns."""
+    rows = Q()
+    for key in keys:
+        rows |= Q(**dict(zip(fields, key)))
+    return model.objects.filter(rows)
+
+
+def _add_stock(
+    model: type[models.Model],
+    keys: tuple[str, ...],
+    deltas: dict[tuple, list],
+):
+    """
+    Adds (quantity, total price) deltas to the rows of `model` identified by
+    the unique `keys` columns, creating missing rows, in a single statement.
+    """
+    # the ORM cannot add to the existing row on conflict, hence raw SQL
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = [*keys, "quantity", "total_price"]
+    updates = [
+        f"quantity = {table}.quantity + EXCLUDED.quantity",
+        f"total_price = {table}.total_price + EXCLUDED.total_price",
+    ]
+
+    values = []
+    params = []
+    for key, (quantity, total_price) in deltas.items():
+        row = [*key, quantity, total_price]
+        values.append(f"({', '.join(['%s'] * len(row))})")
+        params += row
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} ({", ".join(columns)})
+            VALUES {", ".join(values)}
+            ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {", ".join(updates)}
+            """,
+            params,
+        )
+
+
+class Receipt(models.Model):
+    """One checkout; its purchase events are the lines of the receipt."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name="používateľ",
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    total = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="suma")
+    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="dátum a čas")
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.user}; {self.timestamp}"
+
+
+class QueuedCheckout(models.Model):
+    """
+    Checkout in write-behind mode. The credit is already debited; the
+    receipt, stock changes and credit log are written later by the flusher.
+    A checkout the flusher could not write keeps its error in `error` and is
+    skipped until `failed_at` is cleared.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name="používateľ",
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    # [[product id, quantity, unit price], ...]
+    lines = models.JSONField(verbose_name="položky")
+    total = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="suma")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="vytvorené")
+    failed_at = models.DateTimeField(null=True, blank=True, verbose_name="zlyhané")
+    error = models.TextField(blank=True, verbose_name="chyba")
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.user}; {self.created_at}"
+
+    @staticmethod
+    def lock():
+        """
+        Blocks new queued checkouts until the end of the current transaction.
+        PostgreSQL only.
+        """
+        if connection.vendor != "postgresql":
+            return
+        table = connection.ops.quote_name(QueuedCheckout._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table} IN SHARE MODE")
+
+    @staticmethod
+    def product_ids() -> set[int]:
+        """Products with lines in any queued checkout."""
+        return {line[0] for q in QueuedCheckout.objects.all() for line in q.lines}
+
+    @staticmethod
+    def with_products(product_ids: Iterable[int]) -> list["QueuedCheckout"]:
+        """Queued checkouts with a line of any of the products."""
+        product_ids = set(product_ids)
+        return [
+            queued
+            for queued in QueuedCheckout.objects.all()
+            if any(line[0] in product_ids for line in queued.lines)
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a POST sent with an idempotency key, replayed if the request
+    is retried by the same user or session. `status` is empty while the
+    first request is being handled.
+    """
+
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    status = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=128, blank=True)
+    location = models.CharField(max_length=512, blank=True)
+    body = models.BinaryField(default=b"")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "key"], name="idempotency_scope_key_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.scope}; {self.key}; {self.path}; {self.status}"
+
 
 class WarehouseEvent(models.Model):
     class EventType(models.IntegerChoices):
@@ -133,27 +695,23 @@ class WarehouseEvent(models.Model):
         null=True,
         verbose_name="používateľ",
     )
+    receipt = models.ForeignKey(
+        Receipt,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="lines",
+        verbose_name="nákup",
+    )
 
     def __str__(self):
         return f"{self.warehouse}; {self.product}; {self.timestamp}"
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        ws = WarehouseState.objects.filter(
-            product=self.product, warehouse=self.warehouse
-        ).first()
-
-        if not ws:
-            ws = WarehouseState(
-                quantity=0,
-                total_price=0,
-                warehouse=self.warehouse,
-                product=self.product,
-            )
-
-        ws.quantity = ws.quantity + self.quantity
-        ws.total_price = ws.total_price + self.price * self.quantity
-        ws.save()
-
+        # events are a ledger, only a new one changes the stock
+        if self._state.adding:
+            WarehouseState.apply_events([self])
         super().save(*args, **kwargs)
 
     @property
@@ -169,6 +727,143 @@ class WarehouseEvent(models.Model):
         return abs(self.abs_quantity * self.retail_price)
 
 
+class ArchivedWarehouseEvent(models.Model):
+    """Event moved out of the ledger by `archive_ledger`, with its id kept."""
+
+    id = models.BigIntegerField(primary_key=True)
+    type = models.IntegerField(
+        choices=WarehouseEvent.EventType.choices, verbose_name="typ dokladu"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, verbose_name="produkt"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    quantity = models.IntegerField(verbose_name="počet")
+    price = models.DecimalField(
+        max_digits=6, decimal_places=2, verbose_name="skladová cena / ks"
+    )
+    retail_price = models.DecimalField(
+        max_digits=5, decimal_places=2, verbose_name="odbytová cena / ks"
+    )
+    timestamp = models.DateTimeField(verbose_name="dátum a čas")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name="používateľ",
+    )
+    receipt = models.ForeignKey(
+        Receipt,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="nákup",
+    )
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.product}; {self.timestamp}"
+
+
+class EventSummary(models.Model):
+    """
+    Monthly totals of archived events per warehouse, product, user and type.
+    All-time stats add them to the events still in the ledger.
+    """
+
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, verbose_name="produkt"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name="používateľ",
+    )
+    type = models.IntegerField(
+        choices=WarehouseEvent.EventType.choices, verbose_name="typ dokladu"
+    )
+    month = models.DateField(verbose_name="mesiac")
+    quantity = models.IntegerField(verbose_name="počet")
+    total_price = models.DecimalField(
+        max_digits=16, decimal_places=2, verbose_name="skladová cena"
+    )
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.product}; {self.month:%m/%Y}"
+
+
+class PopularityScore(models.Model):
+    """
+    Exponentially decayed purchase count.
+
+    The stored score is valid at `updated_at`; it decays by `POPULARITY_DECAY`
+    per day, so a purchase only needs to decay the old value and add its
+    quantity instead of re-aggregating the event log.
+    """
+
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, verbose_name="sklad"
+    )
+    warehouse_id: int
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, verbose_name="produkt"
+    )
+    product_id: int
+    score = models.FloatField(default=0, verbose_name="skóre")
+    updated_at = models.DateTimeField(verbose_name="aktualizované")
+    last_purchase = models.DateTimeField(verbose_name="posledný nákup")
+
+    class Meta:
+        abstract = True
+
+    def score_at(self, when: datetime) -> float:
+        days = (when - self.updated_at).total_seconds() / 86400
+        return self.score * POPULARITY_DECAY ** max(days, 0)
+
+    def add(self, quantity: int, when: datetime):
+        self.score = self.score_at(when) + quantity
+        self.updated_at = when
+        self.last_purchase = when
+
+
+class ProductPopularity(PopularityScore):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["warehouse", "product"], name="popularity_wh_prod_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.product}; {self.score:.2f}"
+
+
+class UserProductPopularity(PopularityScore):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name="používateľ",
+    )
+    user_id: int
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["warehouse", "product", "user"],
+                name="popularity_wh_prod_user_unique",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse}; {self.product}; {self.user}; {self.score:.2f}"
+
+
 class Reset(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.RESTRICT)
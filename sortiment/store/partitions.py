@@ -0,0 +1,178 @@
+"""
+Monthly partitions of the ledger tables on PostgreSQL.
+
+Rows of a month without a partition land in the default partition and are
+moved out once the partition of their month is created.
+"""
+
+from datetime import date, datetime, timezone
+
+from django.db import connection, models, transaction
+from django.utils.timezone import now
+
+from sortiment.store.models import WarehouseEvent
+from sortiment.users.models import CreditLog
+
+PARTITIONED_MODELS = (WarehouseEvent, CreditLog)
+PARTITION_COLUMN = "timestamp"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def _bound(month: date) -> str:
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def create_partition(table: str, month: date) -> bool:
+    """
+    Creates the partition of `table` for `month` unless it exists. Returns
+    whether it was created.
+    """
+    q = connection.ops.quote_name
+    name = partition_name(table, month)
+    column = q(PARTITION_COLUMN)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        # the partition is filled before attaching it, attaching would fail
+        # while the default partition still has rows of its month
+        cursor.execute(f"CREATE TABLE {q(name)} (LIKE {q(table)} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {q(table + "_default")}
+                WHERE {column} >= {_bound(month)}
+                    AND {column} < {_bound(add_months(month, 1))}
+                RETURNING *
+            )
+            INSERT INTO {q(name)} SELECT * FROM moved
+            """
+        )
+        cursor.execute(
+            f"ALTER TABLE {q(table)} ATTACH PARTITION {q(name)} "
+            f"FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+        )
+    return True
+
+
+def create_partitions(months_ahead: int) -> list[str]:
+    """
+    Creates the partitions of all ledger tables from the current month up to
+    `months_ahead` months ahead. Returns the names of the created ones.
+    """
+    if connection.vendor != "postgresql":
+        return []
+
+    this_month = now().date().replace(day=1)
+    created = []
+    for model in PARTITIONED_MODELS:
+        table = model._meta.db_table
+        for i in range(months_ahead + 1):
+            month = add_months(this_month, i)
+            if create_partition(table, month):
+                created.append(partition_name(table, month))
+    return created
+
+
+def drop_partitions_before(table: str, horizon: datetime) -> list[str]:
+    """
+    Drops the monthly partitions of `table` that end at or before `horizon`,
+    which is much cheaper than deleting their rows. Returns their names.
+    """
+    if connection.vendor != "postgresql":
+        return []
+
+    q = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [table],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+
+        dropped = []
+        for name in names:
+            try:
+                month = datetime.strptime(name[len(table) + 1 :], "%Y_%m").date()
+            except ValueError:
+                # the default partition
+                continue
+            end = datetime.combine(add_months(month, 1), datetime.min.time())
+            if end.replace(tzinfo=timezone.utc) <= horizon:
+                cursor.execute(f"DROP TABLE {q(name)}")
+                dropped.append(name)
+    return dropped
+
+
+def partition_table(model: type[models.Model], months_ahead: int = 3):
+    """
+    Replaces the table of `model` with a copy partitioned by month. Meant for
+    migrations, `model` may be a historical model. PostgreSQL only.
+
+    The primary key of a partitioned table has to contain the partition
+    column, so it becomes (id, timestamp). Ids still come from a sequence.
+    """
+    if connection.vendor != "postgresql":
+        return
+
+    q = connection.ops.quote_name
+    table = model._meta.db_table
+    old = f"{table}_unpartitioned"
+    column = q(PARTITION_COLUMN)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {q(table)} RENAME TO {q(old)}")
+        cursor.execute(
+            f"CREATE TABLE {q(table)} (LIKE {q(old)}) PARTITION BY RANGE ({column})"
+        )
+        cursor.execute(f"ALTER TABLE {q(table)} ADD PRIMARY KEY (id, {column})")
+        cursor.execute(
+            f"CREATE TABLE {q(table + '_default')} PARTITION OF {q(table)} DEFAULT"
+        )
+
+        cursor.execute(f"SELECT min({column}) FROM {q(old)}")
+        first = cursor.fetchone()[0]
+        this_month = now().date().replace(day=1)
+        month = first.date().replace(day=1) if first else this_month
+        while month <= add_months(this_month, months_ahead):
+            create_partition(table, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {q(table)} SELECT * FROM {q(old)}")
+        # also drops the sequence that generated the ids so far
+        cursor.execute(f"DROP TABLE {q(old)}")
+
+        sequence = f"{table}_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {q(sequence)} OWNED BY {q(table)}.id")
+        cursor.execute(
+            f"SELECT setval(%s, coalesce(max(id), 0) + 1, false) FROM {q(table)}",
+            [sequence],
+        )
+        cursor.execute(
+            f"ALTER TABLE {q(table)} ALTER COLUMN id "
+            f"SET DEFAULT nextval('{sequence}'::regclass)"
+        )
+
+        for field in model._meta.concrete_fields:
+            if field.remote_field is None:
+                continue
+            target = field.target_field
+            cursor.execute(
+                f"ALTER TABLE {q(table)} ADD FOREIGN KEY ({q(field.column)}) "
+                f"REFERENCES {q(target.model._meta.db_table)} ({q(target.column)}) "
+                "DEFERRABLE INITIALLY DEFERRED"
+            )
+            if field.db_index:
+                cursor.execute(f"CREATE INDEX ON {q(table)} ({q(field.column)})")
@@ -0,0 +1,109 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+
+from sortiment.store.catalog import Catalog
+from sortiment.store.models import Product
+
+SEARCH_CACHE_TIMEOUT = 60
+SEARCH_CACHE_SIZE = 16
+
+
+def search_products(
+    query: str, products: QuerySet[Product] | None = None
+) -> QuerySet[Product]:
+    """
+    Searches products by name and barcode prefix, best matches first.
+
+    Names are matched against the normalized `search_name` column, which is
+    covered by a trigram index, so both substrings and names with a typo are
+    found. Every result is annotated with its `rank`.
+    """
+    if products is None:
+        products = Product.objects.all()
+
+    term = Product.normalize_name(query)
+    vector = SearchVector("search_name", config="simple")
+    return (
+        products.filter(
+            Q(search_name__contains=term)
+            | Q(search_name__trigram_word_similar=term)
+            | Q(barcode__startswith=query)
+        )
+        .annotate(
+            rank=TrigramWordSimilarity(term, "search_name")
+            + SearchRank(vector, SearchQuery(term, config="simple"))
+        )
+        .order_by("-rank", "name")
+    )
+
+
+def search_listed_products(
+    query: str, catalog: Catalog, session_key: str | None = None
+) -> dict[int, float]:
+    """
+    Returns ranks of listed products matching the query, keyed by product id.
+
+    Recent results are kept per session. A query that extends a cached one
+    (the next keystroke) is narrowed in memory, see `_refine_listed`, and
+    going back to a shorter query reuses its results as they were.
+    """
+    if not session_key:
+        return _search_listed(query)
+
+    # stock changes do not affect the results, only product changes do
+    key = f"search:{session_key}:{catalog.catalog_version}"
+    results: dict[str, dict[int, float]] = cache.get(key) or {}
+
+    if query in results:
+        return results[query]
+
+    parent = max((q for q in results if query.startswith(q)), key=len, default=None)
+    if parent is None:
+        ranks = _search_listed(query)
+    else:
+        ranks = _refine_listed(query, catalog, results[parent])
+
+    results[query] = ranks
+    while len(results) > SEARCH_CACHE_SIZE:
+        del results[next(iter(results))]
+    cache.set(key, results, SEARCH_CACHE_TIMEOUT)
+    return ranks
+
+
+def _search_listed(query: str) -> dict[int, float]:
+    products = Product.objects.filter(is_dummy=False)
+    return dict(search_products(query, products).values_list("id", "rank"))
+
+
+def _refine_listed(
+    query: str, catalog: Catalog, parent: dict[int, float]
+) -> dict[int, float]:
+    """
+    Narrows the results of a shorter query. Substring and barcode matches are
+    picked from the parent results on the catalog snapshot and keep their
+    ranks. Only names matching with a typo are searched in the database, among
+    all listed products, since a typo match need not extend a parent one.
+    """
+    term = Product.normalize_name(query)
+    ranks = {}
+    for product_id, rank in parent.items():
+        product = catalog.products.get(product_id)
+        if product and (
+            term in product.search_name or product.barcode.startswith(query)
+        ):
+            ranks[product_id] = rank
+
+    typos = (
+        Product.objects.filter(is_dummy=False, search_name__trigram_word_similar=term)
+        .exclude(search_name__contains=term)
+        .exclude(barcode__startswith=query)
+        .annotate(rank=TrigramWordSimilarity(term, "search_name"))
+    )
+    ranks.update(typos.values_list("id", "rank"))
+    return ranks
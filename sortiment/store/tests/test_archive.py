@@ -0,0 +1,99 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db.models import Max
+from django.test import TestCase
+from django.utils import timezone
+
+from sortiment.store.helpers.events import new_import, new_receipt
+from sortiment.store.management.commands.rebuild_stock import (
+    expected_stock,
+    live_stock,
+)
+from sortiment.store.models import (
+    ArchivedWarehouseEvent,
+    EventSummary,
+    Product,
+    StockCheckpoint,
+    Warehouse,
+    WarehouseEvent,
+)
+from sortiment.users.management.commands.reconcile_credit import expected_credit
+from sortiment.users.models import (
+    ArchivedCreditLog,
+    CreditCheckpoint,
+    CreditLog,
+    SortimentUser,
+)
+
+
+class ArchiveLedgerTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a")
+        self.user.make_credit_operation(Decimal(20), is_purchase=False)
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        new_import(self.user, self.kofola, self.warehouse, 10, Decimal("0.8"))
+        new_receipt(self.user, self.warehouse, [(self.kofola, 3, Decimal(1))])
+
+        self.old = timezone.now() - timedelta(days=500)
+        WarehouseEvent.objects.update(timestamp=self.old)
+        CreditLog.objects.update(timestamp=self.old)
+
+        # a recent purchase stays in the ledger
+        new_receipt(self.user, self.warehouse, [(self.kofola, 1, Decimal(1))])
+
+    def test_requires_a_year_of_history(self):
+        with self.assertRaises(CommandError):
+            call_command("archive_ledger", months=6, stdout=StringIO())
+
+    def test_moves_old_rows_and_summarizes_them(self):
+        balance = self.user.balance_at(self.old + timedelta(days=1))
+
+        call_command("archive_ledger", stdout=StringIO())
+
+        self.assertEqual(WarehouseEvent.objects.count(), 1)
+        self.assertEqual(ArchivedWarehouseEvent.objects.count(), 2)
+        self.assertEqual(CreditLog.objects.count(), 1)
+        self.assertEqual(ArchivedCreditLog.objects.count(), 2)
+
+        purchases = EventSummary.objects.get(type=WarehouseEvent.EventType.PURCHASE)
+        self.assertEqual(purchases.quantity, -3)
+        self.assertEqual(purchases.total_price, Decimal(-3))
+        self.assertEqual(purchases.month.day, 1)
+
+        self.assertEqual(self.user.balance_at(self.old + timedelta(days=1)), balance)
+        self.assertEqual(self.user.balance_at(timezone.now()), Decimal(16))
+
+    def test_checkpoints_cover_the_archive(self):
+        call_command("archive_ledger", stdout=StringIO())
+
+        stock = StockCheckpoint.objects.get()
+        credit = CreditCheckpoint.objects.get()
+        archived_events = ArchivedWarehouseEvent.objects.aggregate(last=Max("id"))
+        archived_logs = ArchivedCreditLog.objects.aggregate(last=Max("id"))
+        self.assertGreaterEqual(stock.last_event_id, archived_events["last"])
+        self.assertGreaterEqual(credit.last_log_id, archived_logs["last"])
+
+        # replays from the checkpoints and from scratch still agree
+        for checkpoint in (stock, None):
+            self.assertEqual(
+                expected_stock(self.warehouse, checkpoint), live_stock(self.warehouse)
+            )
+        for checkpoint in (credit, None):
+            self.assertEqual(
+                expected_credit(checkpoint), CreditCheckpoint.logged_credit()
+            )
+
+    def test_ids_are_not_reused(self):
+        call_command("archive_ledger", stdout=StringIO())
+        archived = set(ArchivedWarehouseEvent.objects.values_list("id", flat=True))
+
+        new_receipt(self.user, self.warehouse, [(self.kofola, 1, Decimal(1))])
+
+        new = set(WarehouseEvent.objects.values_list("id", flat=True))
+        self.assertFalse(archived & new)
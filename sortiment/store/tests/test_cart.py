@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+from django.http import Http404
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from sortiment.store.catalog import invalidate_catalog
+from sortiment.store.helpers import get_dummy_barcode_data
+from sortiment.store.models import Product, Terminal, Warehouse
+from sortiment.store.views.storefront import get_item_price
+from sortiment.users.models import SortimentUser
+
+
+class ItemPriceTests(SimpleTestCase):
+    def setUp(self):
+        self.one_time = Product(is_dummy=True)
+
+    def test_rounds_to_cents(self):
+        self.assertEqual(get_item_price(self.one_time, "12.345"), Decimal("12.34"))
+
+    def test_regular_product_has_no_item_price(self):
+        self.assertIsNone(get_item_price(Product(is_dummy=False), "1"))
+
+    def test_price_up_to_the_event_field(self):
+        self.assertEqual(get_item_price(self.one_time, "999.99"), Decimal("999.99"))
+        # the largest price a one-time barcode encodes
+        self.assertEqual(
+            get_item_price(self.one_time, str(get_dummy_barcode_data("55555599999"))),
+            Decimal("999.99"),
+        )
+
+    def test_invalid_prices(self):
+        for value in ["1000", "999.999", "1e30", "0", "0.001", "-1", "NaN", "abc"]:
+            with self.subTest(value=value), self.assertRaises(Http404):
+                get_item_price(self.one_time, value)
+
+
+class CartAddPriceTests(TestCase):
+    def setUp(self):
+        # the snapshot of the previous test may carry the same version
+        invalidate_catalog()
+        user = SortimentUser.objects.create(username="a", credit=Decimal(2000))
+        warehouse = Warehouse.objects.create(name="w")
+        Terminal.objects.create(name="t", warehouse=warehouse, network="127.0.0.0/8")
+        self.one_time = Product.get_one_time_product()
+        self.client = Client(REMOTE_ADDR="127.0.0.1")
+        self.client.get(reverse("login", args=[user.id]))
+
+    def test_price_above_the_cap_is_refused(self):
+        url = reverse("store:cart_add", args=[self.one_time.id])
+
+        self.assertEqual(self.client.post(f"{url}?price=1000.00").status_code, 404)
+        self.assertFalse(self.client.session.get("cart"))
+        self.assertEqual(self.client.post(f"{url}?price=999.99").status_code, 200)
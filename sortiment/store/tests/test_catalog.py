@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from sortiment.store.catalog import get_catalog, invalidate_catalog
+from sortiment.store.helpers.events import new_import
+from sortiment.store.models import Product, Tag, Warehouse
+from sortiment.users.models import SortimentUser
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        # the snapshot of the previous test may carry the same version
+        invalidate_catalog()
+        self.user = SortimentUser.objects.create(username="a")
+        self.warehouse = Warehouse.objects.create(name="w")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kofola = Product.objects.create(
+                name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+            )
+            self.horalka = Product.objects.create(
+                name="Horalka", barcode="2", price=Decimal(1), is_unlimited=False
+            )
+            new_import(self.user, self.kofola, self.warehouse, 10, Decimal(1))
+            new_import(self.user, self.horalka, self.warehouse, 5, Decimal(1))
+
+
+class CatalogRefreshTests(CatalogTestCase):
+    def test_unchanged_snapshot_is_reused(self):
+        self.assertIs(get_catalog(), get_catalog())
+
+    def test_stock_change_reloads_stamped_rows(self):
+        old = get_catalog()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_import(self.user, self.kofola, self.warehouse, 3, Decimal(1))
+        new = get_catalog()
+
+        self.assertGreater(new.version, old.version)
+        self.assertIs(new.products, old.products)
+        self.assertEqual(new.catalog_version, old.catalog_version)
+        self.assertEqual(new.local_stock(self.warehouse.id)[self.kofola.id], 13)
+        self.assertEqual(new.total_stock[self.horalka.id], 5)
+        self.assertEqual(new.stock_versions[self.kofola.id], new.version)
+        # the old snapshot is left as it was
+        self.assertEqual(old.total_stock[self.kofola.id], 10)
+
+    def test_product_change_rebuilds_the_snapshot(self):
+        old = get_catalog()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kofola.name = "Kofola citrón"
+            self.kofola.save()
+        new = get_catalog()
+
+        self.assertIsNot(new.products, old.products)
+        self.assertEqual(new.products[self.kofola.id].name, "Kofola citrón")
+        self.assertEqual(new.total_stock[self.kofola.id], 10)
+
+
+class TagSetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.drinks = Tag.objects.create(name="drinks")
+            self.sweets = Tag.objects.create(name="sweets")
+            dummy = Product.get_one_time_product()
+            self.kofola.tags.add(self.drinks)
+            dummy.tags.add(self.drinks)
+
+    def test_listed_members_of_each_tag(self):
+        catalog = get_catalog()
+
+        self.assertEqual(catalog.tag_products["drinks"], {self.kofola.id})
+        self.assertNotIn("sweets", catalog.tag_products)
+        self.assertEqual(
+            [(t.name, count) for t, count in catalog.tag_counts()],
+            [("drinks", 1), ("sweets", 0)],
+        )
@@ -0,0 +1,159 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from sortiment.store.helpers.events import record_events
+from sortiment.store.models import (
+    CatalogVersion,
+    Product,
+    Warehouse,
+    WarehouseEvent,
+    WarehouseState,
+    WarehouseStateShard,
+)
+from sortiment.users.models import SortimentUser
+
+
+class RecordEventsTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a")
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        self.horalka = Product.objects.create(
+            name="Horalka", barcode="2", price=Decimal("0.5"), is_unlimited=False
+        )
+
+    def event(self, product, quantity, price=Decimal(1), type=None):
+        return WarehouseEvent(
+            user=self.user,
+            product=product,
+            warehouse=self.warehouse,
+            type=type or WarehouseEvent.EventType.PURCHASE,
+            quantity=quantity,
+            retail_price=price,
+            price=price,
+        )
+
+    def stock(self, product):
+        return WarehouseState.current_stock(
+            warehouse=self.warehouse, product=product
+        ).get((self.warehouse.id, product.id), [0, Decimal(0)])
+
+    def test_creates_and_adds_to_state_rows(self):
+        imported = WarehouseEvent.EventType.IMPORT
+        record_events(
+            [
+                self.event(self.kofola, 10, Decimal(1), imported),
+                self.event(self.kofola, 5, Decimal(2), imported),
+                self.event(self.horalka, 4, Decimal("0.3"), imported),
+            ]
+        )
+        record_events([self.event(self.kofola, -3)])
+
+        self.assertEqual(self.stock(self.kofola), [12, Decimal(17)])
+        self.assertEqual(self.stock(self.horalka), [4, Decimal("1.2")])
+        self.assertEqual(WarehouseState.objects.count(), 2)
+        self.assertEqual(WarehouseEvent.objects.count(), 4)
+
+    def test_require_stock_refuses_the_whole_batch(self):
+        record_events(
+            [
+                self.event(self.kofola, 2, type=WarehouseEvent.EventType.IMPORT),
+                self.event(self.horalka, 5, type=WarehouseEvent.EventType.IMPORT),
+            ]
+        )
+
+        ok = record_events(
+            [self.event(self.horalka, -1), self.event(self.kofola, -3)],
+            require_stock=True,
+        )
+
+        self.assertFalse(ok)
+        self.assertEqual(self.stock(self.kofola), [2, Decimal(2)])
+        self.assertEqual(self.stock(self.horalka), [5, Decimal(5)])
+        self.assertEqual(WarehouseEvent.objects.count(), 2)
+
+    def test_require_stock_takes_available_stock(self):
+        record_events(
+            [self.event(self.kofola, 3, type=WarehouseEvent.EventType.IMPORT)]
+        )
+
+        self.assertTrue(
+            record_events([self.event(self.kofola, -3)], require_stock=True)
+        )
+        self.assertEqual(self.stock(self.kofola), [0, Decimal(0)])
+
+    def test_sharded_stock(self):
+        self.kofola.sharded_stock = True
+        self.kofola.save()
+
+        record_events(
+            [self.event(self.kofola, 10, type=WarehouseEvent.EventType.IMPORT)]
+        )
+        record_events([self.event(self.kofola, -1), self.event(self.kofola, -2)])
+
+        self.assertTrue(WarehouseStateShard.objects.exists())
+        self.assertEqual(self.stock(self.kofola), [7, Decimal(7)])
+
+        WarehouseState.fold_shards()
+        self.assertFalse(WarehouseStateShard.objects.exists())
+        state = WarehouseState.objects.get(product=self.kofola)
+        self.assertEqual((state.quantity, state.total_price), (7, Decimal(7)))
+
+    @override_settings(STOCK_SHARDS=4)
+    def test_shards_are_picked_at_random(self):
+        self.kofola.sharded_stock = True
+        self.kofola.save()
+
+        with mock.patch("random.randrange", side_effect=[3, 0, 3]) as randrange:
+            for quantity in (-1, -2, -4):
+                record_events([self.event(self.kofola, quantity)])
+
+        randrange.assert_called_with(4)
+        shards = WarehouseStateShard.objects.order_by("shard")
+        self.assertEqual(
+            list(shards.values_list("shard", "quantity")), [(0, -2), (3, -5)]
+        )
+        self.assertEqual(self.stock(self.kofola), [-7, Decimal(-7)])
+
+    def test_fold_shards_of_given_products(self):
+        for product in (self.kofola, self.horalka):
+            product.sharded_stock = True
+            product.save()
+        record_events([self.event(self.kofola, -1), self.event(self.horalka, -2)])
+
+        folded = WarehouseState.fold_shards([(self.warehouse.id, self.kofola.id)])
+
+        self.assertEqual(folded, 1)
+        self.assertEqual(WarehouseStateShard.objects.get().product, self.horalka)
+        self.assertEqual(WarehouseState.objects.get(product=self.kofola).quantity, -1)
+        self.assertEqual(self.stock(self.horalka), [-2, Decimal(-2)])
+        self.assertEqual(WarehouseState.fold_shards([]), 0)
+
+    def test_require_stock_folds_shards_first(self):
+        self.kofola.sharded_stock = True
+        self.kofola.save()
+        record_events(
+            [self.event(self.kofola, 4, type=WarehouseEvent.EventType.IMPORT)]
+        )
+
+        self.assertFalse(
+            record_events([self.event(self.kofola, -5)], require_stock=True)
+        )
+        self.assertTrue(
+            record_events([self.event(self.kofola, -4)], require_stock=True)
+        )
+        self.assertEqual(self.stock(self.kofola), [0, Decimal(0)])
+
+    def test_stamps_written_rows_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_events(
+                [self.event(self.kofola, 1, type=WarehouseEvent.EventType.IMPORT)]
+            )
+
+        state = WarehouseState.objects.get(product=self.kofola)
+        self.assertEqual(state.version, CatalogVersion.current())
+        self.assertGreater(state.version, 0)
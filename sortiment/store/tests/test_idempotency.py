@@ -0,0 +1,114 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from sortiment.store.catalog import invalidate_catalog
+from sortiment.store.helpers.events import new_import
+from sortiment.store.idempotency import IDEMPOTENCY_STALE_AFTER
+from sortiment.store.models import (
+    IdempotencyKey,
+    Product,
+    Receipt,
+    Terminal,
+    Warehouse,
+)
+from sortiment.users.models import SortimentUser
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        # the snapshot of the previous test may carry the same version
+        invalidate_catalog()
+        self.user = SortimentUser.objects.create(username="a", credit=Decimal(10))
+        self.other = SortimentUser.objects.create(username="b", credit=Decimal(10))
+        warehouse = Warehouse.objects.create(name="w")
+        Terminal.objects.create(name="t", warehouse=warehouse, network="127.0.0.0/8")
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        new_import(self.user, self.kofola, warehouse, 10, Decimal(1))
+        self.add_url = reverse("store:cart_add", args=[self.kofola.id])
+
+    def client_for(self, user):
+        client = Client(REMOTE_ADDR="127.0.0.1")
+        if user:
+            client.get(reverse("login", args=[user.id]))
+        return client
+
+    def cart_quantity(self, client):
+        return client.session["cart"][str(self.kofola.id)]["quantity"]
+
+    def test_retry_is_replayed(self):
+        client = self.client_for(self.user)
+
+        first = client.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+        retry = client.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(self.cart_quantity(client), 1)
+
+    def test_key_on_another_path_is_refused(self):
+        client = self.client_for(self.user)
+        client.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+
+        response = client.post(reverse("store:checkout"), HTTP_IDEMPOTENCY_KEY="k")
+
+        self.assertEqual(response.status_code, 422)
+
+    def test_keys_are_scoped_to_the_user(self):
+        client = self.client_for(self.user)
+        other = self.client_for(self.other)
+        client.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+
+        other.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+
+        self.assertEqual(self.cart_quantity(other), 1)
+        self.assertEqual(IdempotencyKey.objects.filter(key="k").count(), 2)
+
+    def test_retried_checkout_after_logout_runs_once(self):
+        client = self.client_for(self.user)
+        client.post(self.add_url)
+
+        first = client.post(reverse("store:checkout"), HTTP_IDEMPOTENCY_KEY="c")
+        retry = client.post(reverse("store:checkout"), HTTP_IDEMPOTENCY_KEY="c")
+
+        self.assertEqual(first.status_code, 302)
+        self.assertIn("next=", retry.url)
+        self.assertEqual(Receipt.objects.count(), 1)
+
+    def test_anonymous_request_claims_nothing(self):
+        client = self.client_for(None)
+
+        response = client.post(reverse("store:checkout"), HTTP_IDEMPOTENCY_KEY="c")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_request_in_progress_conflicts(self):
+        client = self.client_for(self.user)
+        IdempotencyKey.objects.create(
+            scope=f"user:{self.user.id}", key="k", path=self.add_url
+        )
+
+        response = client.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_stale_claim_is_taken_over(self):
+        client = self.client_for(self.user)
+        record = IdempotencyKey.objects.create(
+            scope=f"user:{self.user.id}", key="k", path=self.add_url
+        )
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            created_at=timezone.now() - IDEMPOTENCY_STALE_AFTER - timedelta(minutes=1)
+        )
+
+        response = client.post(self.add_url, HTTP_IDEMPOTENCY_KEY="k")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get(key="k").status, 200)
+        self.assertEqual(self.cart_quantity(client), 1)
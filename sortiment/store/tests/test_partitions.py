@@ -0,0 +1,89 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from sortiment.store.helpers.events import new_import
+from sortiment.store.models import Product, Warehouse, WarehouseEvent
+from sortiment.store.partitions import (
+    PARTITIONED_MODELS,
+    add_months,
+    create_partition,
+    create_partitions,
+    drop_partitions_before,
+    partition_name,
+)
+from sortiment.users.models import SortimentUser
+
+
+class PartitionHelperTests(SimpleTestCase):
+    def test_add_months(self):
+        self.assertEqual(add_months(date(2024, 11, 1), 1), date(2024, 12, 1))
+        self.assertEqual(add_months(date(2024, 12, 1), 1), date(2025, 1, 1))
+        self.assertEqual(add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+        self.assertEqual(add_months(date(2024, 3, 1), -27), date(2021, 12, 1))
+
+    def test_partition_name(self):
+        self.assertEqual(
+            partition_name("store_warehouseevent", date(2024, 3, 1)),
+            "store_warehouseevent_2024_03",
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "partitions need PostgreSQL")
+class PartitionTests(TestCase):
+    table = WarehouseEvent._meta.db_table
+
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a")
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.product = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+
+    def partition_of(self, event: WarehouseEvent) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tableoid::regclass::text FROM {self.table} WHERE id = %s",
+                [event.id],
+            )
+            return cursor.fetchone()[0]
+
+    def test_ledger_tables_are_partitioned(self):
+        with connection.cursor() as cursor:
+            for model in PARTITIONED_MODELS:
+                cursor.execute(
+                    "SELECT 1 FROM pg_partitioned_table "
+                    "WHERE partrelid = %s::regclass",
+                    [model._meta.db_table],
+                )
+                self.assertIsNotNone(cursor.fetchone(), model._meta.db_table)
+
+    def test_rows_land_in_their_month(self):
+        create_partitions(1)
+        new_import(self.user, self.product, self.warehouse, 1, Decimal(1))
+
+        event = WarehouseEvent.objects.get()
+        month = event.timestamp.astimezone(timezone.utc).date().replace(day=1)
+        self.assertEqual(self.partition_of(event), partition_name(self.table, month))
+
+    def test_new_partition_takes_rows_from_default(self):
+        month = date(2001, 1, 1)
+        new_import(self.user, self.product, self.warehouse, 1, Decimal(1))
+        WarehouseEvent.objects.update(
+            timestamp=datetime(2001, 1, 15, tzinfo=timezone.utc)
+        )
+        event = WarehouseEvent.objects.get()
+        self.assertEqual(self.partition_of(event), f"{self.table}_default")
+
+        self.assertTrue(create_partition(self.table, month))
+        self.assertFalse(create_partition(self.table, month))
+        self.assertEqual(self.partition_of(event), partition_name(self.table, month))
+
+        dropped = drop_partitions_before(
+            self.table, datetime(2001, 2, 1, tzinfo=timezone.utc)
+        )
+        self.assertEqual(dropped, [partition_name(self.table, month)])
+        self.assertFalse(WarehouseEvent.objects.exists())
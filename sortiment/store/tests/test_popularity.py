@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from sortiment.store.catalog import invalidate_catalog
+from sortiment.store.helpers.events import new_import, new_receipt
+from sortiment.store.logic import get_ranked_product_ids
+from sortiment.store.models import (
+    Product,
+    ProductPopularity,
+    Terminal,
+    UserProductPopularity,
+    Warehouse,
+)
+from sortiment.users.models import SortimentUser
+
+
+class AddPopularityTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a", credit=Decimal(20))
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        new_import(self.user, self.kofola, self.warehouse, 10, Decimal(1))
+
+    def buy(self, quantity):
+        new_receipt(self.user, self.warehouse, [(self.kofola, quantity, Decimal(1))])
+
+    def test_scores_are_written_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.buy(2)
+            # the checkout itself does not touch the score rows
+            self.assertFalse(ProductPopularity.objects.exists())
+
+        for callback in callbacks:
+            callback()
+
+        self.assertAlmostEqual(ProductPopularity.objects.get().score, 2, places=3)
+        self.assertAlmostEqual(UserProductPopularity.objects.get().score, 2, places=3)
+
+    def test_scores_add_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buy(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buy(3)
+
+        self.assertAlmostEqual(ProductPopularity.objects.get().score, 5, places=3)
+
+
+class RankingTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.user = SortimentUser.objects.create(username="a", credit=Decimal(20))
+        self.warehouse = Warehouse.objects.create(name="w")
+        Terminal.objects.create(
+            name="t", warehouse=self.warehouse, network="127.0.0.0/8"
+        )
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        self.horalka = Product.objects.create(
+            name="Horalka", barcode="2", price=Decimal(1), is_unlimited=False
+        )
+        new_import(self.user, self.kofola, self.warehouse, 10, Decimal(1))
+        new_import(self.user, self.horalka, self.warehouse, 10, Decimal(1))
+        self.client = Client(REMOTE_ADDR="127.0.0.1")
+
+    def ranking(self):
+        return get_ranked_product_ids(self.warehouse, self.user)
+
+    def test_login_refreshes_the_ranking(self):
+        self.assertEqual(self.ranking(), [self.kofola.id, self.horalka.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            new_receipt(self.user, self.warehouse, [(self.horalka, 1, Decimal(1))])
+        # a purchase does not invalidate the cached ranking
+        self.assertEqual(self.ranking(), [self.kofola.id, self.horalka.id])
+
+        self.client.get(reverse("login", args=[self.user.id]))
+
+        self.assertEqual(self.ranking(), [self.horalka.id, self.kofola.id])
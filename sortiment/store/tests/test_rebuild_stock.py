@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from sortiment.store.helpers.events import new_import
+from sortiment.store.management.commands.rebuild_stock import (
+    compare,
+    expected_stock,
+    live_stock,
+    repair,
+)
+from sortiment.store.models import Product, Warehouse, WarehouseState
+from sortiment.users.models import SortimentUser
+
+
+class RepairStockTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a")
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        self.horalka = Product.objects.create(
+            name="Horalka", barcode="2", price=Decimal(1), is_unlimited=False
+        )
+        new_import(self.user, self.kofola, self.warehouse, 10, Decimal(1))
+        new_import(self.user, self.horalka, self.warehouse, 5, Decimal(1))
+
+    def differences(self):
+        # what check_warehouse finds, without closing the test connection
+        return compare(
+            self.warehouse,
+            expected_stock(self.warehouse, None),
+            live_stock(self.warehouse),
+        )
+
+    def test_repairs_the_differing_rows(self):
+        WarehouseState.objects.filter(product=self.kofola).update(quantity=99)
+
+        repaired = repair(self.differences(), None)
+
+        self.assertEqual([d.product_id for d in repaired], [self.kofola.id])
+        self.assertEqual(self.differences(), [])
+
+    def test_stale_differences_are_recomputed(self):
+        WarehouseState.objects.filter(product=self.kofola).update(quantity=99)
+        differences = self.differences()
+        # fixed by someone else before the repair took the lock
+        WarehouseState.objects.filter(product=self.kofola).update(quantity=10)
+
+        self.assertEqual(repair(differences, None), [])
+        self.assertEqual(live_stock(self.warehouse)[self.kofola.id][0], 10)
@@ -0,0 +1,45 @@
+from django.test import TestCase
+
+from sortiment.store.middleware import (
+    TerminalIndex,
+    get_terminal_index,
+    invalidate_terminal_index,
+)
+from sortiment.store.models import Terminal, Warehouse
+
+
+class TerminalIndexTests(TestCase):
+    def setUp(self):
+        invalidate_terminal_index()
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.lab = Terminal.objects.create(
+            name="lab", warehouse=self.warehouse, network="10.0.0.0/8"
+        )
+        self.kiosk = Terminal.objects.create(
+            name="kiosk", warehouse=self.warehouse, network="10.1.2.3/16"
+        )
+        self.v6 = Terminal.objects.create(
+            name="v6", warehouse=self.warehouse, network="2001:db8::/32"
+        )
+
+    def test_longest_prefix_wins(self):
+        index = TerminalIndex(Terminal.objects.all())
+
+        self.assertEqual(index.lookup("10.1.200.7"), self.kiosk)
+        self.assertEqual(index.lookup("10.2.0.1"), self.lab)
+        self.assertEqual(index.lookup("2001:db8::1"), self.v6)
+        self.assertIsNone(index.lookup("192.168.0.1"))
+        self.assertIsNone(index.lookup("::ffff:10.1.0.1"))
+        self.assertIsNone(index.lookup("not an address"))
+
+    def test_terminal_changes_rebuild_the_index(self):
+        index = get_terminal_index()
+        self.assertIs(get_terminal_index(), index)
+
+        office = Terminal.objects.create(
+            name="office", warehouse=self.warehouse, network="192.168.0.0/24"
+        )
+        self.assertEqual(get_terminal_index().lookup("192.168.0.9"), office)
+
+        self.kiosk.delete()
+        self.assertEqual(get_terminal_index().lookup("10.1.200.7"), self.lab)
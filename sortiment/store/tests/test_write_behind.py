@@ -0,0 +1,124 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import ProtectedError
+from django.test import TestCase
+
+from sortiment.store.helpers.events import flush_receipts, new_import, queue_receipt
+from sortiment.store.models import (
+    Product,
+    QueuedCheckout,
+    Receipt,
+    Warehouse,
+    WarehouseEvent,
+    WarehouseState,
+)
+from sortiment.users.models import CreditLog, SortimentUser
+
+
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a", credit=Decimal(10))
+        self.warehouse = Warehouse.objects.create(name="w")
+        self.kofola = Product.objects.create(
+            name="Kofola", barcode="1", price=Decimal(1), is_unlimited=False
+        )
+        new_import(self.user, self.kofola, self.warehouse, 10, Decimal("0.8"))
+
+    def test_queue_only_debits_the_credit(self):
+        queued = queue_receipt(
+            self.user, self.warehouse, [(self.kofola, 3, Decimal(1))]
+        )
+
+        self.assertIsNotNone(queued)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credit, Decimal(7))
+        self.assertFalse(Receipt.objects.exists())
+        self.assertFalse(CreditLog.objects.exists())
+        self.assertEqual(WarehouseState.objects.get().quantity, 10)
+
+    def test_queue_refused_without_credit(self):
+        self.assertIsNone(
+            queue_receipt(self.user, self.warehouse, [(self.kofola, 11, Decimal(1))])
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credit, Decimal(10))
+        self.assertFalse(QueuedCheckout.objects.exists())
+
+    def test_flush_writes_the_ledger(self):
+        queue_receipt(self.user, self.warehouse, [(self.kofola, 3, Decimal(1))])
+        queue_receipt(self.user, self.warehouse, [(self.kofola, 1, Decimal(1))])
+
+        self.assertEqual(flush_receipts(), 2)
+
+        self.assertFalse(QueuedCheckout.objects.exists())
+        self.assertEqual(Receipt.objects.count(), 2)
+        purchases = WarehouseEvent.objects.filter(
+            type=WarehouseEvent.EventType.PURCHASE
+        )
+        self.assertEqual(sorted(e.quantity for e in purchases), [-3, -1])
+        self.assertTrue(all(e.receipt_id for e in purchases))
+        self.assertEqual(WarehouseState.objects.get().quantity, 6)
+        self.assertEqual(
+            sorted(CreditLog.objects.values_list("price", flat=True)),
+            [Decimal(-3), Decimal(-1)],
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credit, Decimal(6))
+        self.assertEqual(flush_receipts(), 0)
+
+    def test_guest_checkout_is_not_logged(self):
+        guest = SortimentUser.objects.create(username="g", is_guest=True)
+        queue_receipt(guest, self.warehouse, [(self.kofola, 2, Decimal(1))])
+
+        flush_receipts()
+
+        self.assertEqual(Receipt.objects.count(), 1)
+        self.assertFalse(CreditLog.objects.exists())
+
+    def test_product_of_queued_checkout_cannot_be_deleted(self):
+        queue_receipt(self.user, self.warehouse, [(self.kofola, 1, Decimal(1))])
+
+        with self.assertRaises(ProtectedError):
+            self.kofola.delete()
+
+        flush_receipts()
+        self.kofola.delete()
+        self.assertFalse(Product.objects.filter(pk=self.kofola.pk).exists())
+
+    def test_failed_checkout_does_not_block_the_queue(self):
+        queue_receipt(self.user, self.warehouse, [(self.kofola, 1, Decimal(1))])
+        broken = QueuedCheckout.objects.create(
+            user=self.user,
+            warehouse=self.warehouse,
+            lines=[[self.kofola.id + 100, 1, "1"]],
+            total=Decimal(1),
+        )
+        queue_receipt(self.user, self.warehouse, [(self.kofola, 2, Decimal(1))])
+
+        self.assertEqual(flush_receipts(), 3)
+        self.assertEqual(flush_receipts(), 0)
+
+        broken.refresh_from_db()
+        self.assertIsNotNone(broken.failed_at)
+        self.assertIn("is gone", broken.error)
+        self.assertEqual(Receipt.objects.count(), 2)
+        self.assertEqual(WarehouseState.objects.get().quantity, 7)
+        self.assertEqual(CreditLog.objects.count(), 2)
+
+    def test_compaction_keeps_queued_products(self):
+        dummy = Product.objects.create(
+            name="Jednorazová položka",
+            barcode="55555500300",
+            price=Decimal(3),
+            is_unlimited=True,
+            is_dummy=True,
+        )
+        queue_receipt(self.user, self.warehouse, [(dummy, 1, Decimal(3))])
+
+        call_command("compact_one_time_products", stdout=StringIO())
+
+        self.assertTrue(Product.objects.filter(pk=dummy.pk).exists())
+        flush_receipts()
+        self.assertFalse(QueuedCheckout.objects.exists())
@@ -5,6 +5,8 @@ from sortiment.store.views import settings, storefront
 app_name = "store"
 urlpatterns = [
     path("", storefront.ProductListView.as_view(), name="product_list"),
+    path("catalog/", storefront.CatalogDataView.as_view(), name="catalog_data"),
+    path("price/", storefront.PriceCheckView.as_view(), name="price_check"),
     path("products/", settings.EventView.as_view(), name="product_management"),
     path("reset/", settings.ResetView.as_view(), name="reset"),
     path("add_product/", settings.AddProductView.as_view(), name="add_product"),
@@ -26,12 +28,9 @@ urlpatterns = [
         "stats/<str:graph>/data", storefront.StatsDataView.as_view(), name="stats_data"
     ),
     path("checkout/", storefront.CheckoutView.as_view(), name="checkout"),
-    path(
-        "cart/<int:product>/remove/",
-        storefront.CartRemoveView.as_view(),
-        name="cart_remove",
-    ),
+    path("cart/update/", storefront.CartUpdateView.as_view(), name="cart_update"),
     path("cart/<int:product>/add/", storefront.CartAddView.as_view(), name="cart_add"),
+    path("cart/scan/", storefront.CartScanView.as_view(), name="cart_scan"),
     path("products/search/", settings.SearchView.as_view(), name="product_search"),
     path("products/discard/", settings.DiscardView.as_view(), name="product_discard"),
     path("products/edit/", settings.EditProductView.as_view(), name="product_edit"),
@@ -2,12 +2,13 @@ from collections import defaultdict
 
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import F, Q, Sum
+from django.db.models import F, Sum
 from django.forms import Form
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, FormView, TemplateView
 
+from sortiment.store.catalog import get_catalog
 from sortiment.store.forms import (
     CorrectionForm,
     DiscardForm,
@@ -22,7 +23,15 @@ from sortiment.store.helpers.events import (
     new_import,
     new_transfer,
 )
-from sortiment.store.models import Product, Reset, Warehouse, WarehouseState
+from sortiment.store.idempotency import IdempotentMixin
+from sortiment.store.models import (
+    Product,
+    Reset,
+    StockCheckpoint,
+    Warehouse,
+    WarehouseState,
+)
+from sortiment.store.search import search_products
 from sortiment.store.views.mixins import StaffRequiredMixin
 from sortiment.turbo import Form422Mixin
 
@@ -43,7 +52,7 @@ class EventView(StaffRequiredMixin, TemplateView):
     template_name = "products/home.html"
 
 
-class AddProductView(StaffRequiredMixin, Form422Mixin, CreateView):
+class AddProductView(StaffRequiredMixin, IdempotentMixin, Form422Mixin, CreateView):
     template_name = "products/create.html"
     form_class = ProductForm
     success_url = reverse_lazy("store:add_product")
@@ -54,7 +63,9 @@ class AddProductView(StaffRequiredMixin, Form422Mixin, CreateView):
         return super().form_valid(form)
 
 
-class EditProductView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView):
+class EditProductView(
+    StaffRequiredMixin, IdempotentMixin, ProductMixin, Form422Mixin, FormView
+):
     template_name = "products/edit.html"
     form_class = ProductForm
     success_url = reverse_lazy("store:product_edit")
@@ -71,26 +82,28 @@ class EditProductView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView):
         return super().form_valid(form)
 
 
-class CorrectionView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView):
+class CorrectionView(
+    StaffRequiredMixin, IdempotentMixin, ProductMixin, Form422Mixin, FormView
+):
     template_name = "products/correction.html"
     form_class = CorrectionForm
     success_url = reverse_lazy("store:correction")
 
+    def get_quantity(self) -> int:
+        warehouse = get_warehouse(self.request)
+        stock = WarehouseState.current_stock(warehouse=warehouse, product=self.product)
+        quantity, _ = stock.get((warehouse.id, self.product.id), (0, 0))
+        return quantity
+
     def get_form_kwargs(self):
         kw = super().get_form_kwargs()
-        state = WarehouseState.objects.filter(
-            warehouse=get_warehouse(self.request), product=self.product
-        ).first()
-        kw["initial"] = {"quantity": state.quantity if state else 0}
+        kw["initial"] = {"quantity": self.get_quantity() if self.product else 0}
         return kw
 
     @transaction.atomic
     def form_valid(self, form):
         warehouse = get_warehouse(self.request)
-        state = WarehouseState.objects.filter(
-            warehouse=warehouse, product=self.product
-        ).first()
-        old_quantity = state.quantity if state else 0
+        old_quantity = self.get_quantity()
 
         new_correction(
             self.request.user,
@@ -102,29 +115,29 @@ class CorrectionView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView):
         return super().form_valid(form)
 
 
-class DiscardView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView):
+class DiscardView(
+    StaffRequiredMixin, IdempotentMixin, ProductMixin, Form422Mixin, FormView
+):
     template_name = "products/discard.html"
     form_class = DiscardForm
     success_url = reverse_lazy("store:product_discard")
 
     def form_valid(self, form):
-        new_discard(
+        if not new_discard(
             self.request.user,
             self.product,
             get_warehouse(self.request),
             form.cleaned_data["quantity"],
-        )
+        ):
+            form.add_error("quantity", "Na sklade nie je dostatočný počet kusov.")
+            return self.form_invalid(form)
         messages.success(self.request, "Vyradenie tovaru bolo úspešné.")
         return super().form_valid(form)
 
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        kwargs["warehouse"] = get_warehouse(self.request)
-        kwargs["product"] = self.product
-        return kwargs
-
 
-class ProductImportView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView):
+class ProductImportView(
+    StaffRequiredMixin, IdempotentMixin, ProductMixin, Form422Mixin, FormView
+):
     template_name = "products/import.html"
     form_class = InsertForm
     success_url = reverse_lazy("store:product_import")
@@ -167,7 +180,7 @@ class ProductImportView(StaffRequiredMixin, ProductMixin, Form422Mixin, FormView
         return super().dispatch(request, *args, **kwargs)
 
 
-class ProductTransferView(StaffRequiredMixin, Form422Mixin, FormView):
+class ProductTransferView(StaffRequiredMixin, IdempotentMixin, Form422Mixin, FormView):
     template_name = "products/transfer.html"
     form_class = TransferForm
     success_url = reverse_lazy("store:product_transfer")
@@ -177,23 +190,21 @@ class ProductTransferView(StaffRequiredMixin, Form422Mixin, FormView):
         ctx["product"] = self.product
         return ctx
 
-    @transaction.atomic
     def form_valid(self, form):
-        new_transfer(
+        if not new_transfer(
             self.request.user,
             self.product,
             form.cleaned_data["from_warehouse"],
             form.cleaned_data["to_warehouse"],
             form.cleaned_data["quantity"],
-        )
+        ):
+            form.add_error(
+                "quantity", "V zdrojovom sklade nie je dostatočny počet kusov."
+            )
+            return self.form_invalid(form)
         messages.success(self.request, "Presun bol úspešný.")
         return super().form_valid(form)
 
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        kwargs["product"] = self.product
-        return kwargs
-
     def dispatch(self, request, *args, **kwargs):
         product = request.GET.get("product")
         self.product = get_object_or_404(Product, id=product) if product else None
@@ -209,10 +220,10 @@ class InventoryView(StaffRequiredMixin, TemplateView):
         products = Product.objects.filter(is_dummy=False, is_unlimited=False).order_by(
             "name"
         )
-        states = WarehouseState.objects.filter(product__in=products).all()
+        current = WarehouseState.current_stock()
         state_map = defaultdict(lambda: 0)
-        for s in states:
-            state_map[(s.product_id, s.warehouse_id)] = s.quantity
+        for (warehouse_id, product_id), (quantity, _) in current.items():
+            state_map[(product_id, warehouse_id)] = quantity
         rows = []
 
         for p in products:
@@ -237,10 +248,14 @@ class InventoryView(StaffRequiredMixin, TemplateView):
         ctx["warehouses"] = warehouses
         ctx["wh_count"] = len(warehouses) + 1
         ctx["rows"] = rows
-        totals = WarehouseState.objects.aggregate(
-            retail_price=Sum(F("quantity") * F("product__price")),
-            import_price=Sum("total_price"),
-        )
+        prices = dict(Product.objects.values_list("id", "price"))
+        totals = {
+            "retail_price": sum(
+                quantity * prices[product_id]
+                for (_, product_id), (quantity, _) in current.items()
+            ),
+            "import_price": sum(total_price for _, total_price in current.values()),
+        }
         ctx["totals"] = totals
         ctx["diff"] = totals["retail_price"] - totals["import_price"]
         return ctx
@@ -253,19 +268,24 @@ class SearchView(StaffRequiredMixin, TemplateView):
         ctx = super().get_context_data(**kwargs)
         query = self.request.GET.get("q")
         if query:
-            ctx["products"] = Product.objects.filter(
-                Q(barcode=query) | Q(name__unaccent__icontains=query)
-            )[0:10]
+            exact = get_catalog().by_barcode(query)
+            if exact:
+                ctx["products"] = [exact]
+            else:
+                ctx["products"] = search_products(query)[0:10]
         ctx["query"] = query
         return ctx
 
 
-class ResetView(StaffRequiredMixin, Form422Mixin, FormView):
+class ResetView(StaffRequiredMixin, IdempotentMixin, Form422Mixin, FormView):
     template_name = "store/reset.html"
     form_class = Form
 
     @transaction.atomic
     def form_valid(self, form):
+        # sales during the reset would be lost by the loop or the checkpoint
+        WarehouseState.lock()
+        WarehouseState.fold_shards()
         totals = WarehouseState.objects.aggregate(
             retail_price=Sum(F("quantity") * F("product__price")),
             import_price=Sum("total_price"),
@@ -279,5 +299,8 @@ class ResetView(StaffRequiredMixin, Form422Mixin, FormView):
             state.total_price = state.quantity * state.product.price
             state.save()
 
+        # the new prices are not events, later rebuilds have to start here
+        StockCheckpoint.take()
+
         messages.success(self.request, f"Reset bol úspešný: {diff}.")
         return redirect("store:product_management")
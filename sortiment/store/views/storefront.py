@@ -1,67 +1,163 @@
 import json
+from collections import Counter
 from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
-from django.db.models import F, Q
-from django.db.models.aggregates import Sum
+from django.db.models import F
+from django.db.models.aggregates import Avg, Sum
 from django.db.models.functions import TruncMonth, TruncWeek
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect, render
 from django.utils import timezone
 from django.utils.timezone import now
 from django.views import View
 from django.views.generic import TemplateView
 
 from sortiment.store.cart import Cart, CartContext
-from sortiment.store.helpers import get_dummy_barcode_data, get_warehouse
-from sortiment.store.logic import get_product_list
-from sortiment.store.models import Product, Tag, Warehouse, WarehouseEvent
+from sortiment.store.catalog import Catalog, get_catalog
+from sortiment.store.helpers import (
+    get_dummy_barcode_data,
+    get_warehouse,
+    parse_scan,
+)
+from sortiment.store.idempotency import IdempotentMixin
+from sortiment.store.logic import (
+    get_product_list,
+    get_ranked_product_ids,
+    get_ranked_product_list,
+)
+from sortiment.store.models import (
+    EventSummary,
+    Product,
+    Receipt,
+    Warehouse,
+    WarehouseEvent,
+)
+from sortiment.store.search import search_listed_products
+from sortiment.turbo import render_turbo
 from sortiment.users.models import CreditLog, SortimentUser
 
 
 class ProductListView(LoginRequiredMixin, CartContext, TemplateView):
     template_name = "store/products.html"
+    paginate_by = 36
 
-    def get_queryset(self):
-        products = Product.objects.filter(is_dummy=False)
+    def get_page(self) -> int:
+        try:
+            return max(int(self.request.GET.get("page", 1)), 1)
+        except ValueError:
+            return 1
+
+    def get_template_names(self):
+        if self.get_page() > 1:
+            return ["store/_products_page.html"]
+        return super().get_template_names()
+
+    def get_products(self, catalog: Catalog) -> list[Product]:
+        products = catalog.listed
+        self.relevance = {}
 
         query = self.request.GET.get("query")
         if query:
-            exact = Product.objects.filter(barcode=query)
-            if exact.exists():
-                return exact
+            exact = catalog.by_barcode(query)
+            if exact:
+                return [exact]
 
             dummy_price = get_dummy_barcode_data(query)
             if dummy_price:
-                dummy_obj = Product.generate_one_time_product(dummy_price, query)
-                return Product.objects.filter(id=dummy_obj.id)
+                return [catalog.one_time_item(dummy_price, query)]
 
-            products = products.filter(
-                Q(name__unaccent__icontains=query) | Q(barcode__startswith=query)
+            self.relevance = search_listed_products(
+                query, catalog, self.request.session.session_key
             )
+            products = [p for p in products if p.id in self.relevance]
 
         # only show products that have active tag
         tag = self.request.GET.get("tag")
         if tag:
-            products = products.filter(tags__name=tag)
+            ids = catalog.tag_products.get(tag, frozenset())
+            products = [p for p in products if p.id in ids]
 
-        return products
+        return list(products)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         warehouse_id = get_warehouse(self.request)
+        catalog = get_catalog()
+
+        products = self.get_products(catalog)
+        page = self.get_page()
+        end = page * self.paginate_by
+        if self.request.GET.get("query"):
+            ranked = get_product_list(
+                products, warehouse_id, self.request.user, self.relevance, limit=end
+            )
+        else:
+            ranked = get_ranked_product_list(
+                products, warehouse_id, self.request.user, limit=end
+            )
+        ctx["products"] = ranked[end - self.paginate_by :]
+        ctx["page"] = page
 
-        products = self.get_queryset()
-        ctx["products"] = get_product_list(products, warehouse_id, self.request.user)
-        ctx["tags"] = Tag.objects.all()
+        if len(products) > end:
+            params = self.request.GET.copy()
+            params["page"] = page + 1
+            ctx["next_page"] = page + 1
+            ctx["next_page_query"] = params.urlencode()
+
+        ctx["tags"] = catalog.tag_counts()
         ctx["show_dummy_hint"] = self.request.GET.get("query", "").startswith("55")
 
         return ctx
 
 
+class CatalogDataView(LoginRequiredMixin, View):
+    def get(self, request):
+        warehouse = get_warehouse(request)
+        try:
+            since = int(request.GET.get("since", 0))
+        except ValueError:
+            since = 0
+
+        data = get_catalog().changes_since(warehouse.id, since)
+        data["warehouse"] = warehouse.id
+        data["ranking"] = get_ranked_product_ids(warehouse, request.user)
+        return HttpResponse(json.dumps(data), content_type="application/json")
+
+
+class PriceCheckView(TemplateView):
+    """
+    Price and stock lookup for anyone at the kiosk. It needs no login and
+    answers from the catalog snapshot, so it never touches the session.
+    """
+
+    template_name = "store/price_check.html"
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        barcode = self.request.GET.get("barcode", "").strip()
+        ctx["barcode"] = barcode
+        if not barcode:
+            return ctx
+
+        catalog = get_catalog()
+        product = catalog.by_barcode(barcode)
+        if not product or product.is_dummy:
+            return ctx
+
+        ctx["product"] = product
+        ctx["total_quantity"] = catalog.total_stock.get(product.id, 0)
+        warehouse = getattr(self.request, "warehouse", None)
+        if warehouse:
+            ctx["local_quantity"] = catalog.local_stock(warehouse.id).get(product.id, 0)
+        else:
+            ctx["local_quantity"] = None
+        return ctx
+
+
 class PurchaseHistoryView(LoginRequiredMixin, TemplateView):
     template_name = "store/purchase_history.html"
 
@@ -73,7 +169,7 @@ class PurchaseHistoryView(LoginRequiredMixin, TemplateView):
                 user=self.request.user, type=WarehouseEvent.EventType.PURCHASE
             )
             .order_by("-timestamp")
-            .select_related("product")
+            .select_related("product", "receipt")
             .filter(timestamp__gte=end)
         )
         credit_events = CreditLog.objects.filter(
@@ -81,8 +177,23 @@ class PurchaseHistoryView(LoginRequiredMixin, TemplateView):
         ).order_by("-timestamp")
 
         events = []
+        receipts = {}
         for e in wh_events:
-            events.append({"event": e, "timestamp": e.timestamp, "type": "product"})
+            if e.receipt_id is None:
+                events.append({"event": e, "timestamp": e.timestamp, "type": "product"})
+                continue
+
+            # lines of one checkout are shown together under their receipt
+            receipt = receipts.get(e.receipt_id)
+            if receipt is None:
+                receipt = receipts[e.receipt_id] = {
+                    "event": e.receipt,
+                    "timestamp": e.receipt.timestamp,
+                    "type": "receipt",
+                    "lines": [],
+                }
+                events.append(receipt)
+            receipt["lines"].append(e)
         for e in credit_events:
             events.append(
                 {
@@ -98,6 +209,26 @@ class PurchaseHistoryView(LoginRequiredMixin, TemplateView):
         return ctx
 
 
+def top_purchased(events, summaries, limit=15) -> list[dict]:
+    """
+    Products with the most sold pieces (the most negative quantity) among
+    `events`, counting the summaries of their archived events as well.
+    """
+    counts = Counter()
+    for queryset in (events, summaries):
+        for name, total in (
+            queryset.values("product__name")
+            .annotate(total_count=Sum("quantity"))
+            .values_list("product__name", "total_count")
+        ):
+            counts[name] += total
+
+    return [
+        {"product__name": name, "total_count": total}
+        for name, total in sorted(counts.items(), key=lambda c: c[1])[:limit]
+    ]
+
+
 class StatsView(TemplateView):
     template_name = "store/stats.html"
 
@@ -132,12 +263,18 @@ class StatsDataView(View):
 
         if time_period == "monthly":
             queryset = queryset.filter(timestamp__gte=now().date() - timedelta(days=30))
-
-        res = list(
-            queryset.values("product__name")
-            .annotate(total_count=Sum("quantity"))
-            .order_by("total_count")[:15]
-        )
+            res = list(
+                queryset.values("product__name")
+                .annotate(total_count=Sum("quantity"))
+                .order_by("total_count")[:15]
+            )
+        else:
+            res = top_purchased(
+                queryset,
+                EventSummary.objects.filter(
+                    warehouse=warehouse, type=WarehouseEvent.EventType.PURCHASE
+                ),
+            )
 
         for row in res:
             data["data"].append(
@@ -204,6 +341,29 @@ class StatsDataView(View):
 
         return data
 
+    def get_basket_trends_data(self, warehouse):
+        """Get average receipt value over last 6 months"""
+        data = {"title": "Priemerný nákup (€)", "type": "line", "data": []}
+        start_date = now().date() - timedelta(days=180)
+
+        res = list(
+            Receipt.objects.filter(warehouse=warehouse, timestamp__gte=start_date)
+            .annotate(month=TruncMonth("timestamp"))
+            .values("month")
+            .annotate(average=Avg("total"))
+            .order_by("month")
+        )
+
+        for row in res:
+            data["data"].append(
+                {
+                    "label": row["month"].strftime("%m/%Y"),
+                    "value": round(float(row["average"]), 2),
+                }
+            )
+
+        return data
+
     def get_category_sales_data(self, warehouse):
         """Get sales by product category for last month"""
         data = {"title": "Predaj podľa kategórií", "type": "pie", "data": []}
@@ -243,6 +403,8 @@ class StatsDataView(View):
             data = self.get_users_spending_data(warehouse)
         elif graph == "revenue_trends":
             data = self.get_revenue_trends_data(warehouse)
+        elif graph == "basket_trends":
+            data = self.get_basket_trends_data(warehouse)
         elif graph == "category_sales":
             data = self.get_category_sales_data(warehouse)
         else:
@@ -251,22 +413,115 @@ class StatsDataView(View):
         return HttpResponse(json.dumps(data), content_type="application/json")
 
 
-class CartRemoveView(LoginRequiredMixin, View):
-    def post(self, request, product):
+def get_item_price(product: Product, value: str) -> Decimal | None:
+    """Price of a one-time item, passed along with its cart line."""
+    if not product.is_dummy:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise Http404()
+    # the price ends up on the purchase event, a longer one would fail to save
+    # at checkout; 555555 barcodes cannot encode more either
+    field = WarehouseEvent._meta.get_field("retail_price")
+    limit = 10 ** (field.max_digits - field.decimal_places)
+    if not price.is_finite() or not 0 < price < limit:
+        raise Http404()
+    price = price.quantize(Decimal("0.01"))
+    if not 0 < price < limit:
+        raise Http404()
+    return price
+
+
+class CartUpdateView(LoginRequiredMixin, IdempotentMixin, View):
+    """
+    Applies several cart changes in one request. The POST carries parallel
+    `product`, `delta` and (for one-time items) `price` lists; either all of
+    them are applied or, if any is invalid, none.
+    """
+
+    def post(self, request):
+        product_ids = request.POST.getlist("product")
+        deltas = request.POST.getlist("delta")
+        prices = request.POST.getlist("price") or [""] * len(product_ids)
+        if not product_ids or not len(product_ids) == len(deltas) == len(prices):
+            raise Http404()
+
+        catalog = get_catalog()
+        changes = []
+        for product_id, delta, price in zip(product_ids, deltas, prices):
+            try:
+                product = catalog.products.get(int(product_id))
+                delta = int(delta)
+            except ValueError:
+                raise Http404()
+            if product is None or delta == 0:
+                raise Http404()
+            changes.append((product, delta, get_item_price(product, price)))
+
         cart = Cart(request)
-        product = get_object_or_404(Product, id=product)
-        cart.remove_product(product, 1)
-        return render(request, "store/_cart.html", {"cart": cart})
+        cart.update(changes)
+        return render_turbo(request, "store/_cart_stream.html", {"cart": cart})
 
 
-class CartAddView(LoginRequiredMixin, View):
+class CartAddView(LoginRequiredMixin, IdempotentMixin, View):
     def post(self, request, product):
         cart = Cart(request)
-        product = get_object_or_404(Product, id=product)
-        cart.add_product(product, 1, False)
+        product = get_catalog().products.get(product)
+        if product is None:
+            raise Http404()
+        cart.add_product(
+            product, 1, get_item_price(product, request.GET.get("price", ""))
+        )
         return render(request, "store/_cart.html", {"cart": cart})
 
 
+class CartScanView(LoginRequiredMixin, IdempotentMixin, View):
+    """
+    Resolves scanned barcodes and adds the products to the cart at once.
+    Several scans may arrive together and `6*<barcode>` adds six pieces.
+    Products of known barcodes are added and unknown barcodes are reported.
+    """
+
+    def post(self, request):
+        catalog = get_catalog()
+        changes = []
+        missing = []
+        for code in request.POST.getlist("barcode"):
+            scan = parse_scan(code.strip())
+            if not scan:
+                missing.append(code.strip())
+                continue
+
+            quantity, barcode = scan
+            product = catalog.by_barcode(barcode)
+            dummy_price = None
+            if not product:
+                dummy_price = get_dummy_barcode_data(barcode)
+                if dummy_price:
+                    product = catalog.one_time_item(dummy_price, barcode)
+
+            if product:
+                changes.append((product, quantity, dummy_price))
+            else:
+                missing.append(barcode)
+
+        cart = Cart(request)
+        if changes:
+            cart.update(changes)
+
+        return render_turbo(
+            request,
+            "store/_scan.html",
+            {
+                "cart": cart,
+                "missing": missing or not changes,
+                "missing_barcodes": [code for code in missing if code],
+                "show_dummy_hint": True,
+            },
+        )
+
+
 class WarehouseTransactionHistoryView(TemplateView):
     template_name = "store/warehouse_history.html"
 
@@ -321,15 +576,19 @@ class WarehouseTransactionHistoryView(TemplateView):
         return ctx
 
 
-class CheckoutView(LoginRequiredMixin, View):
-    @transaction.atomic
+class CheckoutView(LoginRequiredMixin, IdempotentMixin, View):
     def post(self, request):
-        ok = Cart(request).checkout(request)
+        cart = Cart(request)
+        ok = cart.checkout(request)
         if ok:
             messages.success(request, "Nákup bol úspešný!")
             logout(request)
             return redirect("user_list")
         else:
+            if cart.outdated:
+                messages.warning(
+                    request, "Niektoré položky v košíku sa zmenili, skontroluj nákup."
+                )
             return redirect("store:product_list")
 
 
@@ -382,12 +641,18 @@ class PurchaseStatsDataView(LoginRequiredMixin, View):
 
         if time_period == "monthly":
             queryset = queryset.filter(timestamp__gte=now().date() - timedelta(days=30))
-
-        res = list(
-            queryset.values("product__name")
-            .annotate(total_count=Sum("quantity"))
-            .order_by("total_count")[:15]
-        )
+            res = list(
+                queryset.values("product__name")
+                .annotate(total_count=Sum("quantity"))
+                .order_by("total_count")[:15]
+            )
+        else:
+            res = top_purchased(
+                queryset,
+                EventSummary.objects.filter(
+                    user=user, type=WarehouseEvent.EventType.PURCHASE
+                ),
+            )
 
         for row in res:
             data["data"].append(
@@ -12,8 +12,17 @@ Stimulus.register("menu-toggle", MenuToggleController)
 
 Turbo.start()
 
+import { idempotencyKey } from "./idempotency"
+
 document.addEventListener("turbo:before-fetch-request", (event) => {
 	const tokenMeta = document.querySelector('meta[name="csrf-token"]')
 	const token = tokenMeta.getAttribute("value")
 	event.detail.fetchOptions.headers["X-CSRFToken"] = token
+
+	// a resubmitted form reuses its key, so the server replays the response
+	const method = (event.detail.fetchOptions.method || "GET").toUpperCase()
+	if (method !== "GET" && event.target instanceof HTMLFormElement) {
+		event.target.dataset.idempotencyKey ||= idempotencyKey()
+		event.detail.fetchOptions.headers["Idempotency-Key"] = event.target.dataset.idempotencyKey
+	}
 })
@@ -0,0 +1,119 @@
+const STORAGE_KEY = "sortiment-catalog"
+
+export function normalize(text) {
+  return text.normalize("NFKD").replace(/\p{M}/gu, "").toLowerCase()
+}
+
+function emptyState() {
+  return { version: 0, warehouse: null, products: {}, stock: {} }
+}
+
+// Local copy of the product catalog, kept in sync through version deltas.
+export default class Catalog {
+  constructor(url) {
+    this.url = url
+    this.state = this.load()
+    this.ranking = new Map()
+  }
+
+  get ready() {
+    return this.state.version > 0
+  }
+
+  load() {
+    try {
+      return JSON.parse(localStorage.getItem(STORAGE_KEY)) || emptyState()
+    } catch {
+      return emptyState()
+    }
+  }
+
+  save() {
+    try {
+      localStorage.setItem(STORAGE_KEY, JSON.stringify(this.state))
+    } catch {
+      // storage is only a cache, the next page load syncs from scratch
+    }
+  }
+
+  async sync() {
+    const url = new URL(this.url, window.location.href)
+    url.searchParams.set("since", this.state.version)
+
+    const response = await fetch(url, { headers: { Accept: "application/json" } })
+    if (!response.ok) {
+      return
+    }
+    const data = await response.json()
+
+    if (!data.full && data.warehouse !== this.state.warehouse) {
+      this.state = emptyState()
+      return this.sync()
+    }
+    if (data.full) {
+      this.state = emptyState()
+    }
+
+    for (const product of data.products) {
+      this.state.products[product.id] = product
+    }
+    for (const [id, local, total] of data.stock) {
+      this.state.stock[id] = [local, total]
+    }
+
+    const listed = new Set(data.ids)
+    for (const id of Object.keys(this.state.products)) {
+      if (!listed.has(Number(id))) {
+        delete this.state.products[id]
+        delete this.state.stock[id]
+      }
+    }
+
+    this.state.version = data.version
+    this.state.warehouse = data.warehouse
+    this.ranking = new Map(data.ranking.map((id, i) => [id, i]))
+    this.save()
+  }
+
+  annotate(product, term) {
+    const [local, total] = this.state.stock[product.id] || [0, 0]
+    let availability = -1
+    if (product.unlimited || local > 0) {
+      availability = 1
+    } else if (total > 0) {
+      availability = 0
+    }
+
+    return {
+      product,
+      local,
+      total,
+      availability,
+      prefix: term && product.search.startsWith(term) ? 1 : 0,
+      position: this.ranking.get(product.id) ?? Infinity,
+    }
+  }
+
+  search(query) {
+    const products = Object.values(this.state.products)
+
+    const exact = products.find((p) => p.barcode === query)
+    if (exact) {
+      return { items: [this.annotate(exact, "")], exact: true }
+    }
+
+    const term = normalize(query)
+    const items = products
+      .filter((p) => p.search.includes(term) || p.barcode.startsWith(query))
+      .map((p) => this.annotate(p, term))
+
+    items.sort(
+      (a, b) =>
+        b.availability - a.availability ||
+        b.prefix - a.prefix ||
+        a.position - b.position ||
+        a.product.name.localeCompare(b.product.name)
+    )
+    return { items, exact: false }
+  }
+}
@@ -1,38 +1,80 @@
 import { Controller } from "@hotwired/stimulus"
+import { renderStreamMessage } from "@hotwired/turbo"
+import Catalog from "../catalog"
+import { idempotencyKey } from "../idempotency"
+
+const ONE_TIME_ITEM = /^5{6}[0-9]{5}$/
+// an optional `6*` prefix scans six pieces at once
+const BARCODE = /^([0-9]{1,2}\*)?[0-9]{6,}$/
 
 export default class extends Controller {
-  static targets = [ "form", "field", "firstProduct", "productFrame" ]
+  static targets = [ "form", "field", "firstProduct", "productFrame", "card" ]
+  static values = {
+    catalogUrl: String,
+    addUrl: String,
+    scanUrl: String,
+    pageSize: { type: Number, default: 36 },
+  }
 
   connect() {
     this.shouldSelect = false
+    this.pending = false
+    this.scanQueue = []
+    this.scanning = false
     this.productFrameTarget.addEventListener("turbo:frame-load", this.executeSelection)
     this.focusInterval = setInterval(() => {
       this.fieldTarget.focus()
     }, 2000)
+
+    if (this.hasCatalogUrlValue) {
+      this.catalog = new Catalog(this.catalogUrlValue)
+      this.catalog.sync()
+      this.syncInterval = setInterval(() => this.catalog.sync(), 60000)
+    }
   }
 
   disconnect() {
     this.productFrameTarget.removeEventListener("turbo:frame-load", this.executeSelection)
     clearTimeout(this.timeout)
     clearInterval(this.focusInterval)
+    clearInterval(this.syncInterval)
+    this.pageObserver?.disconnect()
   }
 
   search() {
     clearTimeout(this.timeout)
+    if (this.renderLocally()) {
+      this.pending = false
+      return
+    }
+
+    this.pending = true
     this.timeout = setTimeout(() => {
       this.formTarget.requestSubmit()
     }, 200)
   }
 
   select() {
-    if (this.timeout) {
-      this.shouldSelect = true
-    } else {
+    const query = this.fieldTarget.value.trim()
+    if (this.hasScanUrlValue && BARCODE.test(query)) {
+      // the field is cleared right away, so the next scan can start before
+      // this one is answered
+      clearTimeout(this.timeout)
+      this.pending = false
+      this.shouldSelect = false
+      this.fieldTarget.value = ""
+      this.scan(query)
+      return
+    }
+
+    this.shouldSelect = true
+    if (!this.pending) {
       this.executeSelection()
     }
   }
 
   executeSelection = (event) => {
+    this.pending = false
     if (!this.shouldSelect || !this.hasFirstProductTarget) {
       return
     }
@@ -44,4 +86,116 @@ export default class extends Controller {
       this.fieldTarget.value = ""
     }
   }
+
+  // Scans arriving while a request is in flight are sent together in the
+  // next one, so a burst of scans costs a single round trip.
+  scan(barcode) {
+    this.scanQueue.push(barcode)
+    if (!this.scanning) {
+      this.flushScans()
+    }
+  }
+
+  async flushScans() {
+    this.scanning = true
+    const token = document.querySelector('meta[name="csrf-token"]').getAttribute("value")
+
+    while (this.scanQueue.length) {
+      const body = new FormData()
+      this.scanQueue.splice(0).forEach((barcode) => body.append("barcode", barcode))
+      const headers = {
+        Accept: "text/vnd.turbo-stream.html",
+        "X-CSRFToken": token,
+        "Idempotency-Key": idempotencyKey(),
+      }
+
+      // a scan whose answer got lost is sent once more with the same key
+      for (let attempt = 0; attempt < 2; attempt++) {
+        try {
+          const response = await fetch(this.scanUrlValue, { method: "POST", body, headers })
+          if (response.ok) {
+            renderStreamMessage(await response.text())
+          }
+          break
+        } catch (error) {
+          console.error(error)
+        }
+      }
+    }
+
+    this.scanning = false
+  }
+
+  // Renders search results from the synced catalog. Returns false when the
+  // server has to answer instead (one-time items, typo-tolerant search).
+  renderLocally() {
+    const query = this.fieldTarget.value.trim()
+    if (!this.catalog?.ready || ONE_TIME_ITEM.test(query)) {
+      return false
+    }
+
+    const { items, exact } = this.catalog.search(query)
+    if (!items.length) {
+      return false
+    }
+
+    this.pageObserver?.disconnect()
+    const grid = document.createElement("div")
+    grid.className = "grid grid-cols-1 md:grid-cols-3 lg:grid-cols-6 gap-4 p-6"
+    this.renderPage(grid, items, 0, exact)
+    this.productFrameTarget.replaceChildren(grid)
+    return true
+  }
+
+  // Draws one page of results. Like the lazy frames of the server grid, the
+  // next page is drawn once the end of this one scrolls into view.
+  renderPage(grid, items, start, exact) {
+    const end = start + this.pageSizeValue
+    items
+      .slice(start, end)
+      .forEach((item, i) => grid.append(this.renderCard(item, start + i === 0, exact)))
+    if (end >= items.length) {
+      return
+    }
+
+    const next = document.createElement("div")
+    grid.append(next)
+    this.pageObserver = new IntersectionObserver((entries, observer) => {
+      if (entries.some((entry) => entry.isIntersecting)) {
+        observer.disconnect()
+        next.remove()
+        this.renderPage(grid, items, end, exact)
+      }
+    })
+    this.pageObserver.observe(next)
+  }
+
+  renderCard({ product, local, total }, first, exact) {
+    const card = this.cardTarget.content.firstElementChild.cloneNode(true)
+    card.href = this.addUrlValue.replace("/0/", `/${product.id}/`)
+    if (first) {
+      card.dataset.barcodeTarget = "firstProduct"
+    }
+    if (exact) {
+      card.dataset.exactMatch = "1"
+    }
+    if (!product.unlimited && local <= 0) {
+      card.classList.add("opacity-30", "grayscale", "hover:opacity-100")
+    }
+
+    const image = card.querySelector("[data-field=image]")
+    const placeholder = card.querySelector("[data-field=placeholder]")
+    if (product.image) {
+      image.src = product.image
+      placeholder.remove()
+    } else {
+      image.remove()
+    }
+
+    card.querySelector("[data-field=name]").textContent = product.name
+    card.querySelector("[data-field=price]").textContent = product.price
+    card.querySelector("[data-field=stock]").textContent =
+      product.unlimited ? "∞ ks" : `${local}/${total} ks`
+    return card
+  }
 }
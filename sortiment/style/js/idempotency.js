@@ -0,0 +1,6 @@
+// Random key identifying one submission. crypto.randomUUID needs a secure
+// context, which kiosks on the local network may not have.
+export function idempotencyKey() {
+  const bytes = crypto.getRandomValues(new Uint8Array(16))
+  return Array.from(bytes, (b) => b.toString(16).padStart(2, "0")).join("")
+}
@@ -0,0 +1,108 @@
+from decimal import Decimal
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from sortiment.users.models import (
+    ArchivedCreditLog,
+    CreditCheckpoint,
+    CreditLog,
+    SortimentUser,
+)
+
+
+def expected_credit(checkpoint: CreditCheckpoint | None) -> dict[int, Decimal]:
+    """Balances of the checkpoint plus all later credit logs."""
+    credit: dict[int, Decimal] = {}
+    if checkpoint:
+        credit.update(checkpoint.rows.values_list("user_id", "balance"))
+
+    for model in (CreditLog, ArchivedCreditLog):
+        logs = model.objects.filter(user__is_guest=False)
+        if checkpoint:
+            logs = logs.filter(id__gt=checkpoint.last_log_id)
+        for user_id, total in (
+            logs.values("user_id").annotate(s=Sum("price")).values_list("user_id", "s")
+        ):
+            credit[user_id] = credit.get(user_id, Decimal(0)) + total
+    return credit
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifies the credit of every user against the credit log, starting "
+        "at the latest checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Log the differences as credit corrections, keeping the credit.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            action="store_true",
+            help="Save a checkpoint once the credit matches the log.",
+        )
+        parser.add_argument(
+            "--from-scratch",
+            action="store_true",
+            help="Replay the whole credit log. Credit set without a log, e.g. "
+            "in the admin, will show up as differences.",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = None
+        if not options["from_scratch"]:
+            checkpoint = CreditCheckpoint.objects.order_by("-id").first()
+
+        with transaction.atomic():
+            if options["repair"]:
+                CreditCheckpoint.lock()
+            elif connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            expected = expected_credit(checkpoint)
+            live = CreditCheckpoint.logged_credit()
+
+            differences = [
+                (
+                    user_id,
+                    live.get(user_id, Decimal(0)),
+                    expected.get(user_id, Decimal(0)),
+                )
+                for user_id in sorted(expected.keys() | live.keys())
+                if live.get(user_id, 0) != expected.get(user_id, 0)
+            ]
+            if options["repair"]:
+                CreditLog.objects.bulk_create(
+                    CreditLog(
+                        user_id=user_id,
+                        price=live_balance - expected_balance,
+                        is_purchase=False,
+                        message="oprava kreditu",
+                    )
+                    for user_id, live_balance, expected_balance in differences
+                )
+
+        users = SortimentUser.objects.in_bulk(
+            [user_id for user_id, _, _ in differences]
+        )
+        for user_id, live_balance, expected_balance in differences:
+            self.stdout.write(
+                f"{users.get(user_id, user_id)}: {live_balance} € credit, "
+                f"{expected_balance} € from the log"
+            )
+
+        if differences and not options["repair"]:
+            raise CommandError(f"Credit of {len(differences)} users differs.")
+
+        if options["checkpoint"]:
+            CreditCheckpoint.take()
+        if differences:
+            message = f"Logged corrections for {len(differences)} users."
+        else:
+            message = f"Credit of {len(live)} users matches the log."
+        self.stdout.write(self.style.SUCCESS(message))
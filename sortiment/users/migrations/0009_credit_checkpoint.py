@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0008_creditlog_warehouse"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CreditCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, db_index=True, verbose_name="vytvorené"
+                    ),
+                ),
+                ("last_log_id", models.BigIntegerField(verbose_name="posledný záznam")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CreditCheckpointRow",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=8, verbose_name="zostatok"
+                    ),
+                ),
+                (
+                    "checkpoint",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rows",
+                        to="users.creditcheckpoint",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="používateľ",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("checkpoint", "user"), name="credit_checkpoint_user"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from sortiment.store.partitions import partition_table
+
+
+def partition_credit_log(apps, schema_editor):
+    partition_table(apps.get_model("users", "CreditLog"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0009_credit_checkpoint"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_credit_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0028_archivedwarehouseevent_eventsummary"),
+        ("users", "0010_partition_creditlog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedCreditLog",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("timestamp", models.DateTimeField()),
+                ("price", models.DecimalField(decimal_places=2, max_digits=6)),
+                ("is_purchase", models.BooleanField()),
+                ("message", models.CharField(default="", max_length=128)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="store.warehouse",
+                        verbose_name="sklad",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CreditSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="mesiac")),
+                (
+                    "purchases",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="nákupy"
+                    ),
+                ),
+                (
+                    "credit",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="vklady a prevody"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="používateľ",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,15 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0011_archivedcreditlog_creditsummary"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="CreditSummary",
+        ),
+    ]
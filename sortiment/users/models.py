@@ -1,9 +1,12 @@
+from decimal import Decimal
+
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Sum
 
 from sortiment import settings
-from sortiment.store.models import Warehouse
+from sortiment.store.models import QueuedCheckout, Warehouse
 
 
 class SortimentUserManager(BaseUserManager):
@@ -38,11 +41,34 @@ class SortimentUser(AbstractUser):
             return True
         return money <= self.credit
 
+    def reserve_credit(self, money) -> bool:
+        """
+        Adds `money` to the credit in a single UPDATE that only writes the
+        credit column, without logging it. A debit is only applied if the
+        credit covers it; otherwise nothing is written and False is returned.
+        """
+        if self.is_guest:
+            return True
+
+        users = SortimentUser.objects.filter(pk=self.pk)
+        if money < 0:
+            users = users.filter(credit__gte=-money)
+        if not users.update(credit=F("credit") + money):
+            return False
+
+        self.refresh_from_db(fields=["credit"])
+        return True
+
+    @transaction.atomic
     def make_credit_operation(
         self, money, is_purchase, warehouse: Warehouse | None = None, message=""
-    ):
+    ) -> bool:
+        """Changes the credit like `reserve_credit` and logs the change."""
         if self.is_guest:
-            return
+            return True
+        if not self.reserve_credit(money):
+            return False
+
         CreditLog(
             user=self,
             price=money,
@@ -50,8 +76,84 @@ class SortimentUser(AbstractUser):
             warehouse=warehouse,
             message=message,
         ).save()
-        self.credit += money
-        self.save()
+        return True
+
+    @staticmethod
+    @transaction.atomic
+    def transfer_credit(
+        sender: "SortimentUser",
+        receiver: "SortimentUser",
+        money,
+        warehouse: Warehouse | None = None,
+        message="",
+    ) -> bool:
+        """
+        Moves credit between two users. The rows are updated in primary key
+        order, so two opposite transfers cannot deadlock. Returns False and
+        changes nothing if the sender cannot pay.
+        """
+        operations = sorted(
+            [(sender, -money), (receiver, money)], key=lambda o: o[0].pk
+        )
+        for user, amount in operations:
+            if not user.make_credit_operation(
+                amount, is_purchase=False, warehouse=warehouse, message=message
+            ):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    def balance_at(self, timestamp) -> Decimal:
+        """
+        Logged credit of the user at `timestamp`, i.e. after their last log
+        written by then. Checkpoints are bounded by log id, so the timestamp
+        is only used to find that log and the replay itself is ordered by id:
+        forward from the closest earlier checkpoint or backward from the
+        closest later one. Without checkpoints the log is summed up to it.
+        """
+        # old logs may have been archived already
+        ledger = (CreditLog, ArchivedCreditLog)
+        last_id = max(
+            model.objects.filter(user=self, timestamp__lte=timestamp).aggregate(
+                last=models.Max("id")
+            )["last"]
+            or 0
+            for model in ledger
+        )
+
+        before = (
+            CreditCheckpoint.objects.filter(last_log_id__lte=last_id)
+            .order_by("-last_log_id")
+            .first()
+        )
+        after = (
+            CreditCheckpoint.objects.filter(last_log_id__gt=last_id)
+            .order_by("last_log_id")
+            .first()
+        )
+        if before and after:
+            if last_id - before.last_log_id > after.last_log_id - last_id:
+                before = None
+            else:
+                after = None
+
+        if before:
+            balance = before.balance_of(self)
+            logs = {"id__gt": before.last_log_id, "id__lte": last_id}
+            sign = 1
+        elif after:
+            balance = after.balance_of(self)
+            logs = {"id__gt": last_id, "id__lte": after.last_log_id}
+            sign = -1
+        else:
+            balance = Decimal(0)
+            logs = {"id__lte": last_id}
+            sign = 1
+
+        for model in ledger:
+            total = model.objects.filter(user=self, **logs).aggregate(s=Sum("price"))
+            balance += sign * (total["s"] or 0)
+        return balance
 
     @staticmethod
     def get_credit_sum():
@@ -80,3 +182,118 @@ class CreditLog(models.Model):
             f"{self.user} {self.price} {self.timestamp} "
             f"{'purchase' if self.is_purchase else 'credit'}"
         )
+
+
+class CreditCheckpoint(models.Model):
+    """
+    Logged credit of every user after credit log `last_log_id`. Checkouts
+    still queued for write-behind are debited from the credit, but not yet
+    logged, so they are added back to the balances.
+    """
+
+    created_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name="vytvorené"
+    )
+    last_log_id = models.BigIntegerField(verbose_name="posledný záznam")
+
+    def __str__(self):
+        return f"{self.created_at}; {self.last_log_id}"
+
+    def balance_of(self, user: SortimentUser) -> Decimal:
+        row = self.rows.filter(user=user).first()
+        return row.balance if row else Decimal(0)
+
+    @staticmethod
+    def lock():
+        """
+        Blocks credit log writes and queued checkouts until the end of the
+        current transaction. Every credit change is written in the same
+        transaction as its log or queued checkout, so once the lock is held
+        the credit and the log agree. PostgreSQL only.
+        """
+        if connection.vendor != "postgresql":
+            return
+        # same order as the flusher locks them, so we cannot deadlock
+        tables = ", ".join(
+            connection.ops.quote_name(m._meta.db_table)
+            for m in (QueuedCheckout, CreditLog)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {tables} IN EXCLUSIVE MODE")
+
+    @staticmethod
+    def logged_credit() -> dict[int, Decimal]:
+        """Credit of non-guest users plus their queued, unlogged checkouts."""
+        credit = dict(
+            SortimentUser.objects.filter(is_guest=False).values_list("id", "credit")
+        )
+        queued = (
+            QueuedCheckout.objects.filter(user_id__in=credit.keys())
+            .values("user_id")
+            .annotate(total=Sum("total"))
+            .values_list("user_id", "total")
+        )
+        for user_id, total in queued:
+            credit[user_id] += total
+        return credit
+
+    @staticmethod
+    @transaction.atomic
+    def take() -> "CreditCheckpoint":
+        CreditCheckpoint.lock()
+        last_log_id = max(
+            m.objects.aggregate(last=models.Max("id"))["last"] or 0
+            for m in (CreditLog, ArchivedCreditLog)
+        )
+        checkpoint = CreditCheckpoint.objects.create(last_log_id=last_log_id)
+        CreditCheckpointRow.objects.bulk_create(
+            CreditCheckpointRow(checkpoint=checkpoint, user_id=user_id, balance=balance)
+            for user_id, balance in CreditCheckpoint.logged_credit().items()
+        )
+        return checkpoint
+
+
+class CreditCheckpointRow(models.Model):
+    checkpoint = models.ForeignKey(
+        CreditCheckpoint, on_delete=models.CASCADE, related_name="rows"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="používateľ"
+    )
+    user_id: int
+    balance = models.DecimalField(
+        max_digits=8, decimal_places=2, verbose_name="zostatok"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["checkpoint", "user"], name="credit_checkpoint_user"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user}; {self.balance}"
+
+
+class ArchivedCreditLog(models.Model):
+    """Credit log moved out of the ledger by `archive_ledger`, with its id kept."""
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True
+    )
+    timestamp = models.DateTimeField()
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+    is_purchase = models.BooleanField()
+    message = models.CharField(max_length=128, default="")
+    warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.SET_NULL,
+        verbose_name="sklad",
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return f"{self.user} {self.price} {self.timestamp}"
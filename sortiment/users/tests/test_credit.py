@@ -0,0 +1,108 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from sortiment.users.models import CreditCheckpoint, CreditLog, SortimentUser
+
+
+class CreditOperationTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a", credit=Decimal(10))
+
+    def test_debit_within_credit(self):
+        self.assertTrue(self.user.make_credit_operation(Decimal(-4), True))
+        self.assertEqual(self.user.credit, Decimal(6))
+        log = CreditLog.objects.get()
+        self.assertEqual(log.price, Decimal(-4))
+        self.assertTrue(log.is_purchase)
+
+    def test_debit_over_credit_changes_nothing(self):
+        self.assertFalse(self.user.make_credit_operation(Decimal(-11), True))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credit, Decimal(10))
+        self.assertFalse(CreditLog.objects.exists())
+
+    def test_debit_checks_the_stored_credit(self):
+        # another request spent the credit since this instance was loaded
+        SortimentUser.objects.filter(pk=self.user.pk).update(credit=Decimal(2))
+        self.assertFalse(self.user.reserve_credit(Decimal(-5)))
+        self.assertTrue(self.user.reserve_credit(Decimal(-2)))
+        self.assertEqual(self.user.credit, Decimal(0))
+
+    def test_guest_is_not_debited(self):
+        guest = SortimentUser.objects.create(username="g", is_guest=True)
+        self.assertTrue(guest.make_credit_operation(Decimal(-100), True))
+        guest.refresh_from_db()
+        self.assertEqual(guest.credit, Decimal(0))
+        self.assertFalse(CreditLog.objects.exists())
+
+
+class TransferCreditTests(TestCase):
+    def setUp(self):
+        self.sender = SortimentUser.objects.create(username="s", credit=Decimal(10))
+        self.receiver = SortimentUser.objects.create(username="r", credit=Decimal(1))
+
+    def test_transfer(self):
+        self.assertTrue(
+            SortimentUser.transfer_credit(self.sender, self.receiver, Decimal(3))
+        )
+        self.sender.refresh_from_db()
+        self.receiver.refresh_from_db()
+        self.assertEqual(self.sender.credit, Decimal(7))
+        self.assertEqual(self.receiver.credit, Decimal(4))
+        self.assertEqual(
+            sorted(CreditLog.objects.values_list("user_id", "price")),
+            sorted([(self.sender.id, Decimal(-3)), (self.receiver.id, Decimal(3))]),
+        )
+
+    def test_transfer_over_credit_is_rolled_back(self):
+        # the paid user has the lower key, so it is credited first and the
+        # credit has to be rolled back
+        self.assertLess(self.sender.pk, self.receiver.pk)
+        self.assertFalse(
+            SortimentUser.transfer_credit(self.receiver, self.sender, Decimal(5))
+        )
+        self.sender.refresh_from_db()
+        self.receiver.refresh_from_db()
+        self.assertEqual(self.sender.credit, Decimal(10))
+        self.assertEqual(self.receiver.credit, Decimal(1))
+        self.assertFalse(CreditLog.objects.exists())
+
+
+class BalanceAtTests(TestCase):
+    def setUp(self):
+        self.user = SortimentUser.objects.create(username="a")
+        self.start = timezone.now() - timedelta(days=10)
+        self.logs = []
+        for price in (10, -3):
+            self.log(price)
+        self.checkpoint = CreditCheckpoint.take()
+        for price in (5, -1):
+            self.log(price)
+
+    def log(self, price):
+        self.user.make_credit_operation(Decimal(price), price < 0)
+        log = CreditLog.objects.latest("id")
+        timestamp = self.start + timedelta(days=len(self.logs))
+        CreditLog.objects.filter(pk=log.pk).update(timestamp=timestamp)
+        self.logs.append(timestamp)
+
+    def test_replays_forward_from_a_checkpoint(self):
+        # the logs before the checkpoint are not needed any more
+        CreditLog.objects.filter(id__lte=self.checkpoint.last_log_id).delete()
+
+        self.assertEqual(self.user.balance_at(self.logs[2]), Decimal(12))
+        self.assertEqual(self.user.balance_at(self.logs[3]), Decimal(11))
+
+    def test_replays_backward_from_a_checkpoint(self):
+        # a wrong checkpoint shows which side the replay started from
+        self.checkpoint.rows.update(balance=Decimal(100))
+
+        self.assertEqual(self.user.balance_at(self.logs[0]), Decimal(103))
+
+    def test_before_the_first_log(self):
+        self.assertEqual(
+            self.user.balance_at(self.start - timedelta(days=1)), Decimal(0)
+        )
@@ -1,7 +1,7 @@
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction
+from django.core.exceptions import PermissionDenied
 from django.db.models.functions import Lower
 from django.http import HttpResponseRedirect
 from django.urls import reverse, reverse_lazy
@@ -10,6 +10,8 @@ from django.views.generic import CreateView, FormView, ListView
 
 from sortiment.store.cart import CartContext
 from sortiment.store.helpers import get_warehouse
+from sortiment.store.idempotency import IdempotentMixin
+from sortiment.store.logic import precompute_ranking
 from sortiment.turbo import Form422Mixin
 
 from .admin import UserCreationForm
@@ -29,6 +31,12 @@ class LoginUserView(View):
     def get(self, request, user_id):
         user = SortimentUser.objects.get(id=user_id)
         login(request, user)
+
+        try:
+            precompute_ranking(get_warehouse(request), user)
+        except PermissionDenied:
+            pass
+
         return HttpResponseRedirect(reverse("store:product_list"))
 
 
@@ -38,7 +46,7 @@ class LogoutUserView(View):
         return HttpResponseRedirect(reverse("user_list"))
 
 
-class CreateUserView(Form422Mixin, CreateView):
+class CreateUserView(IdempotentMixin, Form422Mixin, CreateView):
     template_name = "users/create.html"
     form_class = UserCreationForm
     success_url = reverse_lazy("user_list")
@@ -48,7 +56,9 @@ class CreateUserView(Form422Mixin, CreateView):
         return super().form_valid(form)
 
 
-class CreditMovementView(LoginRequiredMixin, CartContext, Form422Mixin, FormView):
+class CreditMovementView(
+    LoginRequiredMixin, IdempotentMixin, CartContext, Form422Mixin, FormView
+):
     form_class = CreditMovementForm
     template_name = "users/credit_movement.html"
 
@@ -57,7 +67,6 @@ class CreditMovementView(LoginRequiredMixin, CartContext, Form422Mixin, FormView
         kw["user"] = self.request.user
         return kw
 
-    @transaction.atomic
     def form_valid(self, form):
         warehouse = get_warehouse(self.request)
         user = self.request.user
@@ -65,17 +74,16 @@ class CreditMovementView(LoginRequiredMixin, CartContext, Form422Mixin, FormView
         user2 = form.cleaned_data.get("user")
         message = form.cleaned_data.get("message")
         message = f"{user}: {message}"
-        user.make_credit_operation(
-            -money, is_purchase=False, warehouse=warehouse, message=message
-        )
-        user2.make_credit_operation(
-            money, is_purchase=False, warehouse=warehouse, message=message
-        )
+        if not SortimentUser.transfer_credit(user, user2, money, warehouse, message):
+            form.add_error("credit", "Nemáš dostatok kreditu.")
+            return self.form_invalid(form)
         messages.success(self.request, "Kredit bol presunutý.")
         return HttpResponseRedirect(reverse("store:product_list"))
 
 
-class CreditChangeView(LoginRequiredMixin, CartContext, Form422Mixin, FormView):
+class CreditChangeView(
+    LoginRequiredMixin, IdempotentMixin, CartContext, Form422Mixin, FormView
+):
     form_class = CreditChangeForm
     template_name = "users/credit_change.html"
 
@@ -84,12 +92,15 @@ class CreditChangeView(LoginRequiredMixin, CartContext, Form422Mixin, FormView):
         kw["user"] = self.request.user
         return kw
 
-    @transaction.atomic
     def form_valid(self, form):
         warehouse = get_warehouse(self.request)
         user = self.request.user
         money = form.cleaned_data.get("credit")
-        user.make_credit_operation(money, warehouse=warehouse, is_purchase=False)
+        if not user.make_credit_operation(
+            money, warehouse=warehouse, is_purchase=False
+        ):
+            form.add_error("credit", "Nemáš dostatok kreditu.")
+            return self.form_invalid(form)
         if money > 0:
             messages.success(self.request, "Kredit bol nabitý.")
         else: